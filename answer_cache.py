@@ -0,0 +1,138 @@
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
+import numpy as np
+
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1024"))
+ANSWER_CACHE_TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+# Cosine similarity above which a paraphrased question reuses a cached answer.
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.95"))
+
+def normalize_query(query: str) -> str:
+    return re.sub(r'\s+', ' ', query.lower()).strip().rstrip('?.! ')
+
+class SemanticAnswerCache:
+    """
+    Caches /query answers per (patient, index version). A lookup first tries
+    the normalised question text, then the most similar cached question
+    embedding above `similarity`. Entries expire after `ttl` seconds and the
+    least recently used are dropped beyond `max_entries`. Seeing a new
+    index version for a patient discards that patient's older answers.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+        ttl: float = ANSWER_CACHE_TTL_SECONDS,
+        similarity: float = ANSWER_CACHE_SIMILARITY,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity = similarity
+        self._entries: "OrderedDict[Tuple[str, str, str], Tuple[float, Optional[np.ndarray], Dict]]" = OrderedDict()
+        self._buckets: Dict[Tuple[str, str], Set[Tuple[str, str, str]]] = {}
+        self._versions: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        bucket = self._buckets.get(key[:2])
+        if bucket is not None:
+            bucket.discard(key)
+            if not bucket:
+                del self._buckets[key[:2]]
+
+    def _check_version(self, patient_name: str, version: str):
+        previous = self._versions.get(patient_name)
+        if previous is not None and previous != version:
+            for key in list(self._buckets.get((patient_name, previous), ())):
+                self._remove(key)
+            self.invalidations += 1
+        self._versions[patient_name] = version
+
+    def invalidate(self, patient_name: str):
+        with self._lock:
+            for bucket_key in [b for b in self._buckets if b[0] == patient_name]:
+                for key in list(self._buckets.get(bucket_key, ())):
+                    self._remove(key)
+            self._versions.pop(patient_name, None)
+            self.invalidations += 1
+
+    @staticmethod
+    def _unit(embedding) -> Optional[np.ndarray]:
+        if embedding is None:
+            return None
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def lookup(self, patient_name: str, version: str, query: str, embedding=None) -> Tuple[Optional[Dict], Optional[str]]:
+        """Returns (payload, 'exact' | 'semantic') on a hit, (None, None) otherwise."""
+        if not self.enabled:
+            return None, None
+        now = time.monotonic()
+        with self._lock:
+            self._check_version(patient_name, version)
+            key = (patient_name, version, normalize_query(query))
+            entry = self._entries.get(key)
+            if entry and now - entry[0] <= self.ttl:
+                self._entries.move_to_end(key)
+                self.exact_hits += 1
+                return entry[2], 'exact'
+            if entry:
+                self._remove(key)
+
+            query_vector = self._unit(embedding)
+            if query_vector is None:
+                return None, None
+            best_key, best_score = None, self.similarity
+            for candidate in list(self._buckets.get((patient_name, version), ())):
+                created, vector, _ = self._entries[candidate]
+                if now - created > self.ttl:
+                    self._remove(candidate)
+                    continue
+                if vector is not None:
+                    score = float(vector @ query_vector)
+                    if score >= best_score:
+                        best_key, best_score = candidate, score
+            if best_key is None:
+                self.misses += 1
+                return None, None
+            self._entries.move_to_end(best_key)
+            self.semantic_hits += 1
+            return self._entries[best_key][2], 'semantic'
+
+    def put(self, patient_name: str, version: str, query: str, embedding, payload: Dict):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._check_version(patient_name, version)
+            key = (patient_name, version, normalize_query(query))
+            self._entries[key] = (time.monotonic(), self._unit(embedding), payload)
+            self._entries.move_to_end(key)
+            self._buckets.setdefault(key[:2], set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+
+    def stats(self) -> Dict:
+        lookups = self.exact_hits + self.semantic_hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "exact_hits": self.exact_hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else None,
+            "invalidations": self.invalidations,
+        }
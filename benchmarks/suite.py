@@ -0,0 +1,326 @@
+"""
+Offline end-to-end benchmark: generates a synthetic corpus in a scratch
+directory, starts mock_llm_server.py as the OpenRouter and Gemini APIs, and
+measures
+
+  ingestion       per-patient index build, with empty and with warm text/embedding caches
+  startup         time until the API answers and until every index is warm, cold and warm
+  query           /query throughput and latency under concurrent load
+  summaries       generate_summaries.py wall time on an empty store and on an unchanged one
+
+    python benchmarks/suite.py --patients 20 --docs 8 --llm-latency 0.3 --output bench.json
+    python benchmarks/suite.py --stages ingestion,query --requests 500 --concurrency 32
+
+Latencies are reported as mean/p50/p95/p99 in seconds and everything is
+written to --output as JSON so runs can be diffed. The scratch directory
+(--workdir, a temp dir by default) holds data/, the caches, index storage
+and the logs of the servers started along the way.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import asyncio
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import aiohttp
+from synthetic_corpus import generate_corpus
+from summary_modes import percentile
+
+STAGES = ("ingestion", "startup", "query", "summaries")
+QUESTIONS = [
+    "What medications is the patient currently taking?",
+    "Summarise the patient's chronic conditions.",
+    "What were the most recent lab results?",
+    "Are there any imaging findings of concern?",
+    "What lifestyle recommendations apply to this patient?",
+    "Which prescriptions have refills remaining?",
+]
+# Files and folders the API and the generator leave behind in the working directory.
+STATE_PATHS = ("index_storage", ".embedding_cache", ".text_cache", "patient_store.db", "patient_store.db-wal", "patient_store.db-shm")
+
+def latency_stats(values):
+    if not values:
+        return {"count": 0}
+    return {
+        "count": len(values),
+        "mean_s": round(statistics.mean(values), 4),
+        "p50_s": round(percentile(values, 50), 4),
+        "p95_s": round(percentile(values, 95), 4),
+        "p99_s": round(percentile(values, 99), 4),
+        "max_s": round(max(values), 4),
+    }
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def remove_paths(workdir, names):
+    for name in names:
+        path = os.path.join(workdir, name)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+
+def start_process(args, workdir, env, log_name):
+    log = open(os.path.join(workdir, "logs", log_name), "ab")
+    return subprocess.Popen(args, cwd=workdir, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+def stop_process(proc):
+    proc.terminate()
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+async def wait_for(url, timeout, ready=lambda body: True, proc=None):
+    """Polls `url` until it answers 200 and `ready(json)` holds; returns the seconds waited."""
+    start = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        while time.perf_counter() - start < timeout:
+            if proc is not None and proc.poll() is not None:
+                raise RuntimeError(f"{' '.join(proc.args)} exited with {proc.returncode}, see the logs in the workdir")
+            try:
+                async with session.get(url) as resp:
+                    if resp.status == 200 and ready(await resp.json()):
+                        return time.perf_counter() - start
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.05)
+    raise TimeoutError(f"{url} not ready after {timeout}s")
+
+# ------------------ Stages ------------------
+def bench_ingestion(workdir, rounds):
+    """Builds every patient's index into a scratch storage root, first with empty caches, then with warm ones."""
+    import index_store
+    from llama_index.core import Settings
+    from embedding_cache import CachedEmbedding, EmbeddingCache
+    from text_cache import get_text_cache
+    import generate_summaries
+
+    base_model = generate_summaries.setup_embeddings()._embed_model
+    folders = generate_summaries.patient_folders(os.path.join(workdir, "data"))
+    documents = sum(len(index_store.list_source_files(folder)) for folder in folders.values())
+    results = {}
+    for label in ("cold", "cached"):
+        latencies = []
+        wall = 0.0
+        for _ in range(rounds):
+            storage_root = os.path.join(workdir, "bench_index_storage")
+            shutil.rmtree(storage_root, ignore_errors=True)
+            cache_dir = os.path.join(workdir, "bench_embedding_cache")
+            if label == "cold":
+                shutil.rmtree(cache_dir, ignore_errors=True)
+                shutil.rmtree(get_text_cache().cache_dir, ignore_errors=True)
+            Settings.embed_model = CachedEmbedding(base_model, cache=EmbeddingCache(base_model.model_name, cache_dir=cache_dir))
+            started = time.perf_counter()
+            for patient_name, patient_folder in folders.items():
+                t = time.perf_counter()
+                index_store.load_or_build_index(
+                    patient_name, patient_folder, index_store.build_patient_index,
+                    generate_summaries.hf_model_name, storage_root,
+                )
+                latencies.append(time.perf_counter() - t)
+            wall += time.perf_counter() - started
+        results[label] = {
+            "patients_per_round": len(folders),
+            "documents_per_round": documents,
+            "documents_per_s": round(documents * rounds / wall, 2) if wall else None,
+            "per_patient": latency_stats(latencies),
+        }
+        print(f"  ingestion ({label}): {results[label]['documents_per_s']} documents/s")
+    return results
+
+async def bench_startup(workdir, env, timeout):
+    """Cold: no caches, indexes or store on disk. Warm: everything left by the cold start."""
+    remove_paths(workdir, STATE_PATHS)
+    results = {}
+    proc = None
+    for label in ("cold", "warm"):
+        port = free_port()
+        base = f"http://127.0.0.1:{port}"
+        started = time.perf_counter()
+        proc = start_process(
+            [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port)],
+            workdir, env, f"api-{label}.log",
+        )
+        first_response = await wait_for(f"{base}/patients", timeout, proc=proc)
+        await wait_for(f"{base}/status", timeout, lambda body: body["warmup"]["phase"] == "ready", proc)
+        results[label] = {
+            "first_response_s": round(first_response, 3),
+            "indexes_warm_s": round(time.perf_counter() - started, 3),
+        }
+        print(f"  startup ({label}): serving after {first_response:.2f}s, warm after {results[label]['indexes_warm_s']:.2f}s")
+        if label == "cold":
+            stop_process(proc)
+    return results, proc, base
+
+async def bench_queries(base, patients, requests, concurrency, distinct):
+    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=300)) as session:
+        slots = asyncio.Semaphore(concurrency)
+        latencies = []
+        statuses = Counter()
+        cache_hits = Counter()
+
+        async def one(i):
+            query = QUESTIONS[i % len(QUESTIONS)]
+            if distinct:
+                query = f"{query} (request {i})"
+            payload = {"patient_name": patients[i % len(patients)], "query": query}
+            async with slots:
+                t = time.perf_counter()
+                async with session.post(f"{base}/query", json=payload) as resp:
+                    body = await resp.json(content_type=None)
+                    latencies.append(time.perf_counter() - t)
+                    statuses[resp.status] += 1
+                    if resp.status == 200:
+                        cache_hits[body.get("cache_hit") or "miss"] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        wall = time.perf_counter() - started
+    result = {
+        "requests": requests,
+        "concurrency": concurrency,
+        "distinct_queries": distinct,
+        "throughput_rps": round(requests / wall, 2),
+        "latency": latency_stats(latencies),
+        "status_codes": {str(code): count for code, count in sorted(statuses.items())},
+        "answer_cache": dict(cache_hits),
+    }
+    print(f"  query: {result['throughput_rps']} req/s, p95 {result['latency'].get('p95_s')}s, statuses {result['status_codes']}")
+    return result
+
+async def mock_stats(mock_base):
+    async with aiohttp.ClientSession() as session:
+        async with session.get(f"{mock_base}/stats") as resp:
+            return await resp.json()
+
+async def bench_summaries(workdir, env, rounds, mock_base):
+    """Each round runs generate_summaries.py on an empty store, then again with nothing changed."""
+    runs = {"cold": [], "incremental": []}
+    llm_requests = {"cold": 0, "incremental": 0}
+    for _ in range(rounds):
+        remove_paths(workdir, [p for p in STATE_PATHS if p.startswith("patient_store.db")])
+        for label in ("cold", "incremental"):
+            before = await mock_stats(mock_base)
+            started = time.perf_counter()
+            proc = start_process([sys.executable, os.path.join(ROOT, "generate_summaries.py")], workdir, env, f"summaries-{label}.log")
+            if await asyncio.to_thread(proc.wait) != 0:
+                raise RuntimeError(f"generate_summaries.py exited with {proc.returncode}, see logs/summaries-{label}.log")
+            runs[label].append(time.perf_counter() - started)
+            after = await mock_stats(mock_base)
+            llm_requests[label] += after["requests"] - before["requests"]
+    results = {
+        label: {**latency_stats(values), "llm_requests_per_run": round(llm_requests[label] / rounds, 1)}
+        for label, values in runs.items()
+    }
+    print(f"  summaries: cold p50 {results['cold']['p50_s']}s, incremental p50 {results['incremental']['p50_s']}s")
+    return results
+
+# ------------------ Runner ------------------
+async def run(args, workdir):
+    results = {}
+    port = free_port()
+    mock_base = f"http://127.0.0.1:{port}"
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])),
+        "OPENROUTER_API_KEY": "benchmark",
+        "OPENROUTER_API_URL": f"{mock_base}/api/v1/chat/completions",
+        "GEMINI_API_KEY": "benchmark",
+        "GEMINI_BASE_URL": mock_base,
+    }
+    mock = start_process(
+        [sys.executable, os.path.join(ROOT, "mock_llm_server.py"), "--port", str(port), "--latency", str(args.llm_latency)],
+        workdir, env, "mock_llm_server.log",
+    )
+    api = None
+    try:
+        await wait_for(f"{mock_base}/stats", 30, proc=mock)
+        if "ingestion" in args.stages:
+            print("📊 Ingestion")
+            results["ingestion"] = await asyncio.to_thread(bench_ingestion, workdir, args.rounds)
+        if "startup" in args.stages or "query" in args.stages:
+            print("📊 Startup")
+            results["startup"], api, base = await bench_startup(workdir, env, args.timeout)
+            if "query" in args.stages:
+                print("📊 Query load")
+                patients = sorted(name.strip() for name in os.listdir(os.path.join(workdir, "data")))
+                results["query"] = await bench_queries(base, patients, args.requests, args.concurrency, args.distinct_queries)
+            stop_process(api)
+            api = None
+        if "summaries" in args.stages:
+            print("📊 generate_summaries.py")
+            results["summaries"] = await bench_summaries(workdir, env, args.rounds, mock_base)
+    finally:
+        if api is not None:
+            stop_process(api)
+        stop_process(mock)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark suite for ingestion, startup, queries and summaries.")
+    parser.add_argument("--patients", type=int, default=10)
+    parser.add_argument("--docs", type=int, default=8, help="Documents per patient")
+    parser.add_argument("--pdf-ratio", type=float, default=0.5)
+    parser.add_argument("--pages", type=int, default=2)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Mock OpenRouter/Gemini response time in seconds")
+    parser.add_argument("--requests", type=int, default=200, help="/query requests in the load test")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--distinct-queries", action="store_true", help="Make every query unique to defeat the answer cache")
+    parser.add_argument("--rounds", type=int, default=1, help="Repetitions of the ingestion and summary stages")
+    parser.add_argument("--stages", default=",".join(STAGES), help=f"Comma-separated subset of {', '.join(STAGES)}")
+    parser.add_argument("--timeout", type=float, default=600, help="Seconds to wait for the API to start and warm up")
+    parser.add_argument("--workdir", help="Scratch directory (default: a new temp dir)")
+    parser.add_argument("--keep", action="store_true", help="Keep the temp workdir afterwards")
+    parser.add_argument("--output", default="benchmark_results.json")
+    args = parser.parse_args()
+    args.stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    output = os.path.abspath(args.output)
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix="patient-bench-"))
+    os.makedirs(os.path.join(workdir, "logs"), exist_ok=True)
+    data_root = os.path.join(workdir, "data")
+    shutil.rmtree(data_root, ignore_errors=True)
+    corpus = generate_corpus(data_root, args.patients, args.docs, args.pdf_ratio, args.pages, args.seed)
+    print(f"📄 {corpus['documents']} documents for {corpus['patients']} patients in {data_root}")
+    # Caches and stores use paths relative to the working directory; keep them in the scratch dir.
+    os.chdir(workdir)
+    try:
+        stages = asyncio.run(run(args, workdir))
+    finally:
+        if not args.workdir and not args.keep:
+            os.chdir(ROOT)
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "timestamp": time.time(),
+        "environment": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {key: value for key, value in vars(args).items() if key not in ("workdir", "keep", "output")},
+        "corpus": corpus,
+        **stages,
+    }
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results written to {output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Compares the two summary modes of generate_summaries.py on real patient
+indexes: 'per_section' (three RAG queries per patient) against 'single'
+(one retrieval pass and one JSON-mode LLM call).
+
+Run from the repository root (paths such as data/ are relative):
+
+    python benchmarks/summary_modes.py --patients 5 --latency 0.8
+    python benchmarks/summary_modes.py --live --patients 3      # real OpenRouter, needs OPENROUTER_API_KEY
+
+By default the LLM is the offline mock from mock_llm_server.py, answering
+after --latency seconds, so the numbers isolate retrieval cost and the
+number of round-trips; token counts are the mock's estimate (4 chars/token).
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from aiohttp import web
+from llama_index.core import Settings
+from mock_llm_server import build_app
+from llm_client import get_llm_client
+import generate_summaries
+
+MODES = ("per_section", "single")
+
+async def start_mock_server(latency: float):
+    runner = web.AppRunner(build_app(latency=latency))
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}/api/v1/chat/completions"
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+async def run(args):
+    generate_summaries.setup_embeddings()
+    runner = None
+    if args.live:
+        Settings.llm = generate_summaries.OpenRouterLLM()
+    else:
+        runner, url = await start_mock_server(args.latency)
+        Settings.llm = generate_summaries.OpenRouterLLM(api_key="benchmark", api_url=url)
+
+    folders = list(generate_summaries.patient_folders(args.data_root).items())[:args.patients]
+    indexes = {}
+    for patient_name, patient_folder in folders:
+        index = await asyncio.to_thread(generate_summaries.load_patient_index, patient_name, patient_folder)
+        if index is not None:
+            indexes[patient_name] = index
+    print(f"📊 Benchmarking {len(indexes)} patients, {args.rounds} round(s) per mode")
+
+    client = get_llm_client()
+    results = {}
+    for mode in MODES:
+        before = client.stats()
+        latencies = []
+        failures = 0
+        for _ in range(args.rounds):
+            for patient_name, index in indexes.items():
+                start = time.perf_counter()
+                _, summary = await generate_summaries.generate_summary_for_patient(patient_name, index, mode=mode)
+                latencies.append(time.perf_counter() - start)
+                failures += summary is None
+        after = client.stats()
+        runs = len(latencies)
+        results[mode] = {
+            "patients": runs,
+            "failures": failures,
+            "latency_mean_s": round(statistics.mean(latencies), 3),
+            "latency_p50_s": round(percentile(latencies, 50), 3),
+            "latency_p95_s": round(percentile(latencies, 95), 3),
+            "llm_calls_per_patient": round((after["requests"] - before["requests"]) / runs, 2),
+            "prompt_tokens_per_patient": round((after["prompt_tokens"] - before["prompt_tokens"]) / runs),
+            "completion_tokens_per_patient": round((after["completion_tokens"] - before["completion_tokens"]) / runs),
+        }
+
+    await client.aclose()
+    if runner is not None:
+        await runner.cleanup()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark per-section vs single-pass summary generation.")
+    parser.add_argument("--patients", type=int, default=5)
+    parser.add_argument("--rounds", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.5, help="Mock LLM response time in seconds")
+    parser.add_argument("--data-root", default="data")
+    parser.add_argument("--live", action="store_true", help="Call the real OpenRouter API instead of the mock")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    columns = list(next(iter(results.values())))
+    print(f"\n{'metric':<32}" + "".join(f"{mode:>14}" for mode in MODES))
+    for column in columns:
+        print(f"{column:<32}" + "".join(f"{results[mode][column]:>14}" for mode in MODES))
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
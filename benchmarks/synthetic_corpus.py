@@ -0,0 +1,141 @@
+"""
+Generates a synthetic data/<patient>/ tree of clinical-looking PDFs and TXTs
+for benchmarks, at whatever scale is asked for:
+
+    python benchmarks/synthetic_corpus.py --out /tmp/bench/data --patients 50 --docs 12 --pdf-ratio 0.6 --pages 3
+
+Output is deterministic for a given --seed. Documents follow the categories
+in document_classifier.py so classification has something to work with.
+"""
+import os
+import random
+import argparse
+import fitz  # PyMuPDF
+
+FIRST_NAMES = ["Maria", "James", "Aisha", "Chen", "Olga", "Diego", "Priya", "Samuel", "Fatima", "Lukas", "Grace", "Tomas"]
+LAST_NAMES = ["Alvarez", "Okafor", "Nguyen", "Schmidt", "Haddad", "Kowalski", "Ramirez", "Ito", "Byrne", "Mensah"]
+MEDICATIONS = [
+    ("Lisinopril", "10mg tablet", "once daily"), ("Metformin", "500mg tablet", "twice daily"),
+    ("Atorvastatin", "20mg tablet", "at bedtime"), ("Levothyroxine", "75mcg tablet", "every morning"),
+    ("Amlodipine", "5mg tablet", "once daily"), ("Omeprazole", "20mg capsule", "before breakfast"),
+    ("Sertraline", "50mg tablet", "once daily"), ("Albuterol", "90mcg inhaler", "as needed"),
+    ("Gabapentin", "300mg capsule", "three times daily"), ("Warfarin", "5mg tablet", "once daily"),
+]
+CONDITIONS = [
+    "essential hypertension", "type 2 diabetes mellitus", "hyperlipidemia", "hypothyroidism",
+    "gastroesophageal reflux disease", "major depressive disorder", "mild persistent asthma",
+    "osteoarthritis of the knee", "paroxysmal atrial fibrillation", "chronic low back pain",
+]
+LABS = [
+    ("Hemoglobin A1c", "%", 5.0, 9.5), ("LDL cholesterol", "mg/dL", 70, 190), ("TSH", "mIU/L", 0.4, 6.0),
+    ("Creatinine", "mg/dL", 0.6, 1.6), ("Potassium", "mmol/L", 3.4, 5.3), ("Hemoglobin", "g/dL", 10.5, 16.5),
+]
+LIFESTYLE = [
+    "walks 30 minutes most days", "is a former smoker (quit 2015)", "drinks alcohol socially",
+    "follows a low-sodium diet", "reports poor sleep", "works night shifts", "swims twice a week",
+]
+
+def patient_names(count: int, rng: random.Random):
+    return [f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {i:04d}" for i in range(count)]
+
+def clinical_note(name, rng):
+    meds = rng.sample(MEDICATIONS, rng.randint(2, 5))
+    conditions = rng.sample(CONDITIONS, rng.randint(1, 3))
+    return [
+        "PROGRESS NOTE",
+        f"Patient: {name}",
+        f"Visit date: 2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+        f"Chief complaint: follow-up of {conditions[0]}.",
+        f"Vitals: BP {rng.randint(110, 160)}/{rng.randint(65, 95)}, HR {rng.randint(58, 102)}, "
+        f"weight {rng.randint(55, 110)} kg.",
+        "Assessment: " + "; ".join(conditions) + ".",
+        "Current medications:",
+        *[f"- {drug} {dose}, {freq}" for drug, dose, freq in meds],
+        f"Social history: patient {rng.choice(LIFESTYLE)} and {rng.choice(LIFESTYLE)}.",
+        "Plan: continue current regimen, recheck labs in three months, return sooner if symptoms worsen.",
+    ]
+
+def lab_result(name, rng):
+    lines = ["LABORATORY REPORT", f"Patient: {name}", f"Collected: 2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+             "Test                 Result    Units     Reference"]
+    for test, unit, low, high in rng.sample(LABS, rng.randint(3, len(LABS))):
+        value = round(rng.uniform(low, high), 1)
+        lines.append(f"{test:<20} {value:<9} {unit:<9} {low}-{high}")
+    lines.append("Results reviewed by the ordering physician.")
+    return lines
+
+def prescription(name, rng):
+    drug, dose, freq = rng.choice(MEDICATIONS)
+    return [
+        "PRESCRIPTION", f"Patient: {name}", f"Rx: {drug} {dose}",
+        f"Sig: take {freq}.", f"Dispense: {rng.choice([30, 60, 90])}", f"Refills: {rng.randint(0, 5)}",
+        "Prescriber: Dr. Example, MD",
+    ]
+
+def imaging_report(name, rng):
+    study = rng.choice(["Chest X-ray, two views", "MRI lumbar spine without contrast", "Echocardiogram", "CT abdomen"])
+    return [
+        "IMAGING REPORT", f"Patient: {name}", f"Study: {study}",
+        "Findings: no acute abnormality; mild degenerative changes noted.",
+        "Impression: stable compared with prior examination.",
+    ]
+
+def insurance(name, rng):
+    return [
+        "INSURANCE AUTHORIZATION", f"Member: {name}", f"Member ID: {rng.randint(10**8, 10**9 - 1)}",
+        f"Plan: {rng.choice(['PPO Gold', 'HMO Standard', 'Medicare Advantage'])}",
+        "Authorization approved for outpatient services for 12 months.",
+    ]
+
+DOCUMENT_TYPES = [
+    ("Progress Note", clinical_note), ("Lab Result", lab_result), ("Prescription", prescription),
+    ("Imaging Report", imaging_report), ("Insurance", insurance),
+]
+
+def write_pdf(path, pages):
+    doc = fitz.open()
+    for lines in pages:
+        page = doc.new_page()
+        page.insert_textbox(fitz.Rect(50, 50, page.rect.width - 50, page.rect.height - 50), "\n".join(lines), fontsize=10)
+    doc.save(path)
+    doc.close()
+
+def generate_corpus(out_dir: str, patients: int = 10, docs_per_patient: int = 8, pdf_ratio: float = 0.5,
+                    pages: int = 2, seed: int = 7) -> dict:
+    """Writes the tree and returns counts of what was written."""
+    rng = random.Random(seed)
+    totals = {"patients": 0, "documents": 0, "pdf": 0, "txt": 0, "bytes": 0}
+    for name in patient_names(patients, rng):
+        folder = os.path.join(out_dir, name)
+        os.makedirs(folder, exist_ok=True)
+        for i in range(docs_per_patient):
+            title, make = rng.choice(DOCUMENT_TYPES)
+            if rng.random() < pdf_ratio:
+                path = os.path.join(folder, f"{title} {i + 1}.pdf")
+                write_pdf(path, [make(name, rng) for _ in range(pages)])
+                totals["pdf"] += 1
+            else:
+                path = os.path.join(folder, f"{title} {i + 1}.txt")
+                with open(path, "w") as f:
+                    f.write("\n\n".join("\n".join(make(name, rng)) for _ in range(pages)))
+                totals["txt"] += 1
+            totals["documents"] += 1
+            totals["bytes"] += os.path.getsize(path)
+        totals["patients"] += 1
+    return totals
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic patient document corpus.")
+    parser.add_argument("--out", required=True, help="Directory to create patient folders in (e.g. <workdir>/data)")
+    parser.add_argument("--patients", type=int, default=10)
+    parser.add_argument("--docs", type=int, default=8, help="Documents per patient")
+    parser.add_argument("--pdf-ratio", type=float, default=0.5, help="Fraction of documents written as PDF")
+    parser.add_argument("--pages", type=int, default=2, help="Pages (sections, for TXT) per document")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    totals = generate_corpus(args.out, args.patients, args.docs, args.pdf_ratio, args.pages, args.seed)
+    print(f"📄 Wrote {totals['documents']} documents ({totals['pdf']} PDF, {totals['txt']} TXT, "
+          f"{totals['bytes'] / 1e6:.1f} MB) for {totals['patients']} patients to {args.out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import os
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from text_extraction import read_documents
+
+CATEGORIES = ["Clinical Note", "Lab Result", "Prescription", "Imaging Report", "Insurance", "Other"]
+# Characters of a document used for classification, as in the LLM prompt.
+SNIPPET_CHARS = 2000
+# Predictions below this confidence go to the LLM instead.
+CLASSIFIER_MIN_CONFIDENCE = float(os.getenv("CLASSIFIER_MIN_CONFIDENCE", "0.6"))
+# Softmax temperature over centroid cosine similarities.
+CLASSIFIER_TEMPERATURE = float(os.getenv("CLASSIFIER_TEMPERATURE", "0.05"))
+# Categories with fewer labelled examples than this get no centroid.
+CLASSIFIER_MIN_EXAMPLES = int(os.getenv("CLASSIFIER_MIN_EXAMPLES", "3"))
+
+def document_snippet(text: str) -> str:
+    return text.strip()[:SNIPPET_CHARS]
+
+class NearestCentroidClassifier:
+    """
+    Classifies document snippets by cosine similarity between their embedding
+    and the mean embedding of each category's labelled examples. Confidence is
+    the softmax of those similarities, so a snippet halfway between two
+    centroids scores low and can be deferred to the LLM.
+    """
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        min_confidence: float = CLASSIFIER_MIN_CONFIDENCE,
+        temperature: float = CLASSIFIER_TEMPERATURE,
+    ):
+        self.embed_model = embed_model
+        self.min_confidence = min_confidence
+        self.temperature = temperature
+        self.labels: List[str] = []
+        self.centroids: Optional[np.ndarray] = None
+        self.examples = 0
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None and len(self.labels) >= 2
+
+    def _embed(self, snippets: List[str]) -> np.ndarray:
+        vectors = np.asarray(self.embed_model.get_text_embedding_batch(snippets), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0)
+
+    def fit(self, snippets: List[str], labels: List[str]) -> "NearestCentroidClassifier":
+        counts = Counter(labels)
+        keep = [i for i, label in enumerate(labels) if snippets[i] and counts[label] >= CLASSIFIER_MIN_EXAMPLES]
+        self.labels = sorted({labels[i] for i in keep})
+        self.examples = len(keep)
+        if len(self.labels) < 2:
+            self.centroids = None
+            return self
+        vectors = self._embed([snippets[i] for i in keep])
+        kept_labels = np.array([labels[i] for i in keep])
+        centroids = np.stack([vectors[kept_labels == label].mean(axis=0) for label in self.labels])
+        self.centroids = centroids / np.linalg.norm(centroids, axis=1, keepdims=True)
+        return self
+
+    def predict(self, snippets: List[str]) -> List[Tuple[str, float]]:
+        """Returns (category, confidence) per snippet; empty snippets are ('Other', 1.0)."""
+        if not self.trained:
+            return [("Other", 0.0 if snippet else 1.0) for snippet in snippets]
+        results: List[Tuple[str, float]] = [("Other", 1.0)] * len(snippets)
+        filled = [i for i, snippet in enumerate(snippets) if snippet]
+        if not filled:
+            return results
+        scores = self._embed([snippets[i] for i in filled]) @ self.centroids.T / self.temperature
+        scores -= scores.max(axis=1, keepdims=True)
+        probabilities = np.exp(scores)
+        probabilities /= probabilities.sum(axis=1, keepdims=True)
+        for row, i in enumerate(filled):
+            best = int(probabilities[row].argmax())
+            results[i] = (self.labels[best], float(probabilities[row, best]))
+        return results
+
+    def confident(self, confidence: float) -> bool:
+        return confidence >= self.min_confidence
+
+def train_from_manifest(manifest: Dict[str, List[Dict]], embed_model: BaseEmbedding) -> NearestCentroidClassifier:
+    """Fits a classifier on every manifest document that still exists and has a valid category."""
+    labelled = {
+        doc["path"]: doc["category"]
+        for docs in manifest.values()
+        for doc in docs
+        if doc.get("category") in CATEGORIES and os.path.isfile(doc["path"])
+    }
+    texts = read_documents(list(labelled))
+    paths = [path for path in labelled if path in texts]
+    classifier = NearestCentroidClassifier(embed_model)
+    classifier.fit([document_snippet(texts[path]) for path in paths], [labelled[path] for path in paths])
+    return classifier
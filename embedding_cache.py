@@ -0,0 +1,179 @@
+import os
+import re
+import fcntl
+import struct
+import hashlib
+import threading
+from typing import Dict, List, Optional
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from metrics import record_cache, stage_timer
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", ".embedding_cache")
+
+class EmbeddingCache:
+    """
+    Append-only binary cache of text embeddings for one model. The file holds
+    a small header (magic, version, dimension) followed by fixed-size records
+    of a 32-byte SHA-256 of the chunk text and its float32 vector. Appends
+    take an exclusive flock, so several processes can share the file; new
+    records written by others are picked up on the next miss.
+    """
+
+    MAGIC = b'EMBC'
+    VERSION = 1
+    HEADER = struct.Struct('<4sII')
+
+    def __init__(self, model_name: str, cache_dir: str = EMBEDDING_CACHE_DIR):
+        self.model_name = model_name
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)
+        self.path = os.path.join(cache_dir, f"{slug}.bin")
+        self.dim: Optional[int] = None
+        self.hits = 0
+        self.misses = 0
+        self._vectors: Dict[bytes, np.ndarray] = {}
+        self._offset = 0
+        self._lock = threading.Lock()
+        self._refresh()
+
+    @staticmethod
+    def key(text: str) -> bytes:
+        return hashlib.sha256(text.encode('utf-8')).digest()
+
+    def _record_dtype(self) -> np.dtype:
+        return np.dtype([('key', 'V32'), ('vec', '<f4', (self.dim,))])
+
+    def _refresh(self):
+        """Loads records appended to the file since the last refresh."""
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            if self.dim is None:
+                header = f.read(self.HEADER.size)
+                if len(header) < self.HEADER.size:
+                    return
+                magic, version, dim = self.HEADER.unpack(header)
+                if magic != self.MAGIC or version != self.VERSION:
+                    print(f"⚠️ Ignoring embedding cache {self.path}: unrecognised format")
+                    return
+                self.dim = dim
+                self._offset = self.HEADER.size
+            f.seek(self._offset)
+            data = f.read()
+        dtype = self._record_dtype()
+        count = len(data) // dtype.itemsize
+        if not count:
+            return
+        records = np.frombuffer(data, dtype=dtype, count=count)
+        for record in records:
+            self._vectors[record['key'].tobytes()] = record['vec']
+        self._offset += count * dtype.itemsize
+
+    def get_many(self, texts: List[str]) -> List[Optional[Embedding]]:
+        keys = [self.key(text) for text in texts]
+        with self._lock:
+            if any(key not in self._vectors for key in keys):
+                self._refresh()
+            found = [self._vectors.get(key) for key in keys]
+        hits = sum(vector is not None for vector in found)
+        self.hits += hits
+        self.misses += len(found) - hits
+        return [vector.tolist() if vector is not None else None for vector in found]
+
+    def put_many(self, texts: List[str], embeddings: List[Embedding]):
+        if not texts:
+            return
+        vectors = np.asarray(embeddings, dtype='<f4')
+        with self._lock:
+            if self.dim is None:
+                self._refresh()
+            if self.dim is not None and vectors.shape[1] != self.dim:
+                return
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(self.path, 'ab') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    if f.tell() == 0:
+                        f.write(self.HEADER.pack(self.MAGIC, self.VERSION, vectors.shape[1]))
+                    elif self.dim is None:
+                        return
+                    records = np.empty(len(texts), dtype=np.dtype([('key', 'V32'), ('vec', '<f4', (vectors.shape[1],))]))
+                    records['key'] = [self.key(text) for text in texts]
+                    records['vec'] = vectors
+                    f.write(records.tobytes())
+                    f.flush()
+                finally:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._offset = self.HEADER.size
+            for text, vector in zip(texts, vectors):
+                self._vectors[self.key(text)] = vector
+
+class CachedEmbedding(BaseEmbedding):
+    """Wraps an embedding model so chunk texts already in the EmbeddingCache are never re-embedded."""
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, embed_model: BaseEmbedding, cache: Optional[EmbeddingCache] = None, **kwargs):
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs,
+        )
+        self._embed_model = embed_model
+        self._cache = cache or EmbeddingCache(embed_model.model_name)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        with stage_timer("query_embedding"):
+            return self._embed_model._get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        with stage_timer("query_embedding"):
+            return await self._embed_model._aget_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _missing(self, texts: List[str], embeddings: List[Optional[Embedding]]) -> List[str]:
+        missing = list(dict.fromkeys(text for text, embedding in zip(texts, embeddings) if embedding is None))
+        record_cache("embedding", hits=len(texts) - sum(embedding is None for embedding in embeddings), misses=len(missing))
+        return missing
+
+    def _fill(self, texts, embeddings, missing, computed) -> List[Embedding]:
+        self._cache.put_many(missing, computed)
+        by_text = dict(zip(missing, computed))
+        return [embedding if embedding is not None else by_text[text] for text, embedding in zip(texts, embeddings)]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        embeddings = self._cache.get_many(texts)
+        missing = self._missing(texts, embeddings)
+        if not missing:
+            return embeddings
+        with stage_timer("embedding"):
+            computed = self._embed_model._get_text_embeddings(missing)
+        return self._fill(texts, embeddings, missing, computed)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        embeddings = self._cache.get_many(texts)
+        missing = self._missing(texts, embeddings)
+        if not missing:
+            return embeddings
+        with stage_timer("embedding"):
+            computed = await self._embed_model._aget_text_embeddings(missing)
+        return self._fill(texts, embeddings, missing, computed)
@@ -0,0 +1,157 @@
+"""
+One embedding model shared by every API worker and by generate_summaries.py.
+
+    python embedding_service.py --port 8200
+    EMBEDDING_SERVICE_URL=http://127.0.0.1:8200 uvicorn app:app --workers 4
+
+The service loads torch and the HuggingFace model once, behind the same
+on-disk EmbeddingCache the in-process model uses. Clients talk to it through
+RemoteEmbedding, which needs neither torch nor the model, so an API worker
+costs little more than its memory-mapped indexes.
+"""
+import os
+import json
+import time
+import asyncio
+import argparse
+import threading
+import http.client
+from typing import List, Optional
+from urllib.parse import urlsplit
+from aiohttp import web
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+EMBEDDING_SERVICE_URL = os.getenv("EMBEDDING_SERVICE_URL")
+EMBEDDING_SERVICE_TIMEOUT = float(os.getenv("EMBEDDING_SERVICE_TIMEOUT", "120"))
+# How long clients wait for the service to come up before giving up.
+EMBEDDING_SERVICE_WAIT_SECONDS = float(os.getenv("EMBEDDING_SERVICE_WAIT_SECONDS", "120"))
+
+class EmbeddingServiceError(Exception):
+    pass
+
+# ------------------ Server ------------------
+def build_app(embed_model: BaseEmbedding) -> web.Application:
+    stats = {"requests": 0, "texts": 0}
+    # One batch at a time on the model; concurrent requests queue here instead of oversubscribing the CPU.
+    model_lock = asyncio.Lock()
+
+    async def embed(request: web.Request) -> web.Response:
+        payload = await request.json()
+        texts = payload.get("texts") or []
+        stats["requests"] += 1
+        stats["texts"] += len(texts)
+        async with model_lock:
+            if payload.get("query"):
+                embeddings = await asyncio.to_thread(lambda: [embed_model.get_query_embedding(text) for text in texts])
+            else:
+                embeddings = await asyncio.to_thread(embed_model.get_text_embedding_batch, texts)
+        return web.json_response({"model": embed_model.model_name, "embeddings": embeddings})
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({"model": embed_model.model_name, **stats})
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app.router.add_post("/embed", embed)
+    app.router.add_get("/health", health)
+    return app
+
+# ------------------ Client ------------------
+class RemoteEmbedding(BaseEmbedding):
+    """Embeds through a running embedding_service.py; one keep-alive connection per thread."""
+
+    _url: str = PrivateAttr()
+    _timeout: float = PrivateAttr()
+    _local: threading.local = PrivateAttr()
+
+    def __init__(self, url: str, model_name: str, timeout: float = EMBEDDING_SERVICE_TIMEOUT, **kwargs):
+        super().__init__(model_name=model_name, **kwargs)
+        self._url = url.rstrip("/")
+        self._timeout = timeout
+        self._local = threading.local()
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "RemoteEmbedding"
+
+    def _connection(self, fresh: bool = False) -> http.client.HTTPConnection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None or fresh:
+            if conn is not None:
+                conn.close()
+            parts = urlsplit(self._url)
+            conn_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+            conn = conn_class(parts.netloc, timeout=self._timeout)
+            self._local.conn = conn
+        return conn
+
+    def _request(self, method: str, path: str, payload: Optional[dict] = None) -> dict:
+        body = json.dumps(payload) if payload is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        for attempt in range(2):
+            conn = self._connection(fresh=attempt > 0)
+            try:
+                conn.request(method, urlsplit(self._url).path + path, body=body, headers=headers)
+                resp = conn.getresponse()
+                data = resp.read()
+            except (http.client.HTTPException, OSError) as e:
+                # A keep-alive connection the server has closed; retry once on a new one.
+                if attempt:
+                    raise EmbeddingServiceError(f"Embedding service at {self._url} unreachable: {e}") from e
+                continue
+            if resp.status != 200:
+                raise EmbeddingServiceError(f"Embedding service returned HTTP {resp.status}: {data[:200]!r}")
+            return json.loads(data)
+
+    def _embed(self, texts: List[str], query: bool = False) -> List[Embedding]:
+        return self._request("POST", "/embed", {"texts": texts, "query": query})["embeddings"]
+
+    def wait_until_ready(self, timeout: float = EMBEDDING_SERVICE_WAIT_SECONDS) -> dict:
+        """Polls /health until the service answers; checks it serves the expected model."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                health = self._request("GET", "/health")
+                break
+            except EmbeddingServiceError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(1)
+        if health.get("model") != self.model_name:
+            raise EmbeddingServiceError(f"Embedding service serves {health.get('model')}, expected {self.model_name}")
+        return health
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._embed([query], query=True)[0]
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await asyncio.to_thread(self._get_query_embedding, query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._embed([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return self._embed(texts)
+
+def remote_embedding(model_name: str, url: Optional[str] = EMBEDDING_SERVICE_URL) -> Optional[RemoteEmbedding]:
+    """RemoteEmbedding for `url` once the service is up, or None when no service is configured."""
+    if not url:
+        return None
+    embed_model = RemoteEmbedding(url, model_name)
+    print(f"🔗 Waiting for the embedding service at {url}...")
+    health = embed_model.wait_until_ready()
+    print(f"🔗 Using the embedding service at {url} ({health['model']})")
+    return embed_model
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve one shared embedding model over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8200)
+    parser.add_argument("--model", default="sentence-transformers/all-MiniLM-L6-v2")
+    args = parser.parse_args()
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+    from embedding_cache import CachedEmbedding
+    print(f"🔧 Loading {args.model}...")
+    model = CachedEmbedding(HuggingFaceEmbedding(model_name=args.model))
+    print(f"🧮 Embedding service on http://{args.host}:{args.port}")
+    web.run_app(build_app(model), host=args.host, port=args.port, print=None)
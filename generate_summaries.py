@@ -1,42 +1,46 @@
 import os
 import json
 import asyncio
-import fitz
-import aiohttp
-from typing import Optional
+from typing import Dict, Optional, Tuple
 from llama_index.core.indices.vector_store.base import VectorStoreIndex
 from llama_index.core import Settings
-from llama_index.core.schema import Document
-from llama_index.core.llms import LLM
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from llama_index.core.llms import LLM, ChatMessage, ChatResponse, LLMMetadata, MessageRole
+from embedding_cache import CachedEmbedding
+from embedding_service import remote_embedding
+from text_extraction import read_text_file, read_pdf_file_robust, read_documents
+from text_cache import file_digest
+from patient_store import get_patient_store
+from index_store import build_patient_index, current_index_version, load_or_build_index, stored_index_version
+from document_classifier import CATEGORIES, NearestCentroidClassifier, document_snippet, train_from_manifest
+from retrieval import retrieve_union, pack_context
+from llm_client import OPENROUTER_API_URL, get_llm_client, run_sync
+import metrics
+
+# Patients summarised at once; each needs its index in memory and makes one LLM call (three in per_section mode).
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+
+# 'single': one merged retrieval over the section queries and one JSON-mode LLM call per patient; 'per_section': three RAG queries.
+SUMMARY_MODE = os.getenv("SUMMARY_MODE", "single")
+# Nodes retrieved per section query in single-pass mode, and the token budget of the merged context.
+SUMMARY_TOP_K = int(os.getenv("SUMMARY_TOP_K", "6"))
+SUMMARY_CONTEXT_TOKEN_BUDGET = int(os.getenv("SUMMARY_CONTEXT_TOKEN_BUDGET", "6000"))
 
-SUMMARY_CACHE_FILE = 'patient_summary_cache.json'
-DOCUMENT_MANIFEST_FILE = 'document_manifest.json'
-
-# Set up HuggingFace embeddings to avoid OpenAI embedding requirements
 hf_model_name = "sentence-transformers/all-MiniLM-L6-v2"
-embed_model = HuggingFaceEmbedding(model_name=hf_model_name)
-Settings.embed_model = embed_model
-
-def read_pdf_file_robust(file_path):
-    text = ""
-    try:
-        with fitz.open(file_path) as doc:
-            for page in doc:
-                text += page.get_text()
-    except Exception as e:
-        print(f"    - ❗️ Error reading {os.path.basename(file_path)} with PyMuPDF: {e}")
-    return text
 
-def read_text_file(file_path):
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return f.read()
+def setup_embeddings():
+    """Set up HuggingFace embeddings (or the shared embedding service, when configured) to avoid OpenAI embedding requirements."""
+    embed_model = remote_embedding(hf_model_name)
+    if embed_model is None:
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+        embed_model = CachedEmbedding(HuggingFaceEmbedding(model_name=hf_model_name))
+    Settings.embed_model = embed_model
+    return embed_model
 
 class OpenRouterLLM(LLM):
     api_key: str
     model: str = "gpt-4o-mini"
     temperature: float = 0.0
-    api_url: str = "https://openrouter.ai/api/v1/chat/completions"
+    api_url: str = OPENROUTER_API_URL
 
     def __init__(self, **kwargs):
         if "api_key" not in kwargs:
@@ -46,10 +50,10 @@ class OpenRouterLLM(LLM):
         super().__init__(**kwargs)
 
     @property
-    def metadata(self) -> dict:
-        return {"model_name": self.model}
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(model_name=self.model, context_window=128000, is_chat_model=True)
 
-    async def achat(self, messages):
+    async def _request(self, messages, **params) -> str:
         headers = {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json",
@@ -58,21 +62,30 @@ class OpenRouterLLM(LLM):
             "model": self.model,
             "messages": messages,
             "temperature": self.temperature,
+            **params,
         }
-        async with aiohttp.ClientSession() as session:
-            async with session.post(self.api_url, headers=headers, json=json_data) as resp:
-                resp.raise_for_status()
-                response_json = await resp.json()
-                return response_json["choices"][0]["message"]["content"]
+        # Shared keep-alive session; rate limiting, concurrency caps and retries live in the client.
+        response_json = await get_llm_client().post_json(self.api_url, json_data, headers=headers)
+        return response_json["choices"][0]["message"]["content"]
 
-    def chat(self, messages):
-        return asyncio.run(self.achat(messages))
+    async def achat(self, messages, **kwargs) -> ChatResponse:
+        # Query engines hand over ChatMessage objects; the API wants plain role/content dicts.
+        payload = [
+            message if isinstance(message, dict) else {"role": message.role.value, "content": message.content}
+            for message in messages
+        ]
+        content = await self._request(payload)
+        return ChatResponse(message=ChatMessage(role=MessageRole.ASSISTANT, content=content))
 
-    async def acomplete(self, prompt: str):
-        return await self.achat([{"role": "user", "content": prompt}])
+    def chat(self, messages, **kwargs) -> ChatResponse:
+        return run_sync(self.achat(messages))
 
-    def complete(self, prompt: str):
-        return asyncio.run(self.acomplete(prompt))
+    async def acomplete(self, prompt: str, formatted: bool = False, **params) -> str:
+        """Returns the completion text; extra params (e.g. response_format) go into the request body."""
+        return await self._request([{"role": "user", "content": prompt}], **params)
+
+    def complete(self, prompt: str, formatted: bool = False, **params) -> str:
+        return run_sync(self.acomplete(prompt, **params))
 
     async def astream_chat(self, messages):
         raise NotImplementedError("Streaming not supported")
@@ -87,151 +100,240 @@ class OpenRouterLLM(LLM):
         raise NotImplementedError("Streaming not supported")
 
 
-def load_all_patient_indexes(data_root='data'):
-    print("Starting real index loading process for all patients...")
-    patient_indexes = {}
-    llm = OpenRouterLLM()
-    Settings.llm = llm
-
-    for patient_name_raw in os.listdir(data_root):
-        patient_name = patient_name_raw.strip()
-        patient_folder = os.path.join(data_root, patient_name_raw)
-        if not os.path.isdir(patient_folder):
-            continue
-        print(f"\nProcessing patient: {patient_name}")
-        documents = []
-        for filename in os.listdir(patient_folder):
-            file_path = os.path.join(patient_folder, filename)
-            text = ""
-            if filename.lower().endswith('.pdf'):
-                text = read_pdf_file_robust(file_path)
-            elif filename.lower().endswith('.txt'):
-                text = read_text_file(file_path)
-            if text.strip():
-                documents.append(Document(text=text, doc_id=file_path))
-        if not documents:
-            print(f"  - No readable documents found for {patient_name}, skipping index creation.")
-            continue
-        print(f"  - Creating AI index from {len(documents)} documents...")
-        index = VectorStoreIndex.from_documents(documents)
-        patient_indexes[patient_name] = index
-        print(f"  - ✅ Index created for {patient_name}.")
-    return patient_indexes
-
-async def classify_document(filepath: str, llm: OpenRouterLLM):
-    print(f"  - Classifying '{os.path.basename(filepath)}'...")
-    content_snippet = ""
-    if filepath.lower().endswith('.pdf'):
-        content_snippet = read_pdf_file_robust(filepath).strip()[:2000]
-    else:
-        content_snippet = read_text_file(filepath).strip()[:2000]
+def patient_folders(data_root='data') -> Dict[str, str]:
+    return {
+        name.strip(): os.path.join(data_root, name)
+        for name in sorted(os.listdir(data_root))
+        if os.path.isdir(os.path.join(data_root, name))
+    }
+
+def load_patient_index(patient_name: str, patient_folder: str) -> Optional[VectorStoreIndex]:
+    """Loads the patient's persisted index (shared with the API), rebuilding it only if its documents changed."""
+    return load_or_build_index(patient_name, patient_folder, build_patient_index, hf_model_name)
+
+async def classify_document(filepath: str, llm: OpenRouterLLM, content_snippet: Optional[str] = None):
+    print(f"  - Classifying '{os.path.basename(filepath)}' with the LLM...")
+    if content_snippet is None:
+        if filepath.lower().endswith('.pdf'):
+            content_snippet = document_snippet(read_pdf_file_robust(filepath))
+        else:
+            content_snippet = document_snippet(read_text_file(filepath))
     if not content_snippet:
         print("    - Could not read content, skipping classification.")
         return "Other"
     prompt = f"""Based on the following text from a medical document, classify it into ONE of the following categories: [Clinical Note, Lab Result, Prescription, Imaging Report, Insurance, Other]. Respond with ONLY the category name and nothing else. Text snippet: --- {content_snippet} --- Category:"""
     category = await llm.acomplete(prompt)
-    valid_categories = ["Clinical Note", "Lab Result", "Prescription", "Imaging Report", "Insurance", "Other"]
     category = category.strip()
-    if category not in valid_categories:
+    if category not in CATEGORIES:
         return "Other"
     print(f"    - Classified as: {category}")
     return category
 
-async def generate_summary_for_patient(patient_name: str, index: VectorStoreIndex):
+SUMMARY_QUERIES = {
+    "medication_summary": "Provide a clear summary of the patient's prescribed medications based on the medical records.",
+    "lifestyle_recommendations": "Based on the patient's medical records, list key lifestyle recommendations.",
+    "condition_summary": "Summarize the patient's diagnosed conditions and relevant medical history.",
+}
+
+STRUCTURED_SUMMARY_PROMPT = """\
+You are a knowledgeable medical AI assistant summarising a patient's medical records.
+CONTEXT INFORMATION:
+{context_str}
+Using only the records above, write three sections:
+- "medication_summary": {medication_summary}
+- "lifestyle_recommendations": {lifestyle_recommendations}
+- "condition_summary": {condition_summary}
+If the records hold no information for a section, say so in that section.
+Respond with a single JSON object with exactly these three string fields and nothing else."""
+
+async def generate_summary_per_section(patient_name: str, index: VectorStoreIndex, llm: Optional[LLM] = None) -> Dict[str, str]:
+    """One RAG query (retrieval plus LLM call) per summary section."""
+    query_engine = index.as_query_engine(llm=llm or Settings.llm)
+    responses = await asyncio.gather(*(query_engine.aquery(q) for q in SUMMARY_QUERIES.values()))
+    return {key: str(response) for key, response in zip(SUMMARY_QUERIES, responses)}
+
+def parse_structured_summary(text: str) -> Dict[str, str]:
+    text = text.strip()
+    if text.startswith("```"):
+        text = text.strip("`").removeprefix("json").strip()
+    data = json.loads(text)
+    summary = {}
+    for key in SUMMARY_QUERIES:
+        value = data.get(key)
+        if value is None:
+            raise ValueError(f"structured summary is missing '{key}'")
+        summary[key] = "\n".join(map(str, value)) if isinstance(value, list) else str(value)
+    return summary
+
+async def generate_summary_single_pass(patient_name: str, index: VectorStoreIndex, llm: Optional[LLM] = None) -> Dict[str, str]:
+    """Retrieves for all three sections into one merged context and asks for them in one JSON-mode LLM call."""
+    nodes = await asyncio.to_thread(retrieve_union, index, list(SUMMARY_QUERIES.values()), SUMMARY_TOP_K)
+    with metrics.stage_timer("prompt_assembly"):
+        context_str, _, _ = pack_context(nodes, SUMMARY_CONTEXT_TOKEN_BUDGET)
+        prompt = STRUCTURED_SUMMARY_PROMPT.format(context_str=context_str, **SUMMARY_QUERIES)
+    text = await (llm or Settings.llm).acomplete(prompt, response_format={"type": "json_object"})
+    return parse_structured_summary(text)
+
+@metrics.timed("summary")
+async def generate_summary_for_patient(patient_name: str, index: VectorStoreIndex, mode: str = SUMMARY_MODE, llm: Optional[LLM] = None):
     print(f"  - Generating AI summary for {patient_name}...")
     try:
-        query_engine = index.as_query_engine(llm=Settings.llm)
-        queries = {
-            "medication_summary": "Provide a clear summary of the patient's prescribed medications based on the medical records.",
-            "lifestyle_recommendations": "Based on the patient's medical records, list key lifestyle recommendations.",
-            "condition_summary": "Summarize the patient's diagnosed conditions and relevant medical history.",
-        }
-        tasks = [query_engine.aquery(q) for q in queries.values()]
-        responses = await asyncio.gather(*tasks)
-        summary_data = {
-            "medication_summary": str(responses[0]),
-            "lifestyle_recommendations": str(responses[1]),
-            "condition_summary": str(responses[2]),
-        }
+        if mode == "single":
+            try:
+                summary_data = await generate_summary_single_pass(patient_name, index, llm)
+            except ValueError as e:
+                # Covers malformed JSON too (JSONDecodeError is a ValueError).
+                print(f"  - ⚠️ Structured summary unusable for {patient_name} ({e}), falling back to per-section queries.")
+                summary_data = await generate_summary_per_section(patient_name, index, llm)
+        else:
+            summary_data = await generate_summary_per_section(patient_name, index, llm)
         print(f"  - ✅ Summary generated for {patient_name}.")
         return patient_name, summary_data
     except Exception as e:
         print(f"  - ❌ FAILED to generate summary for {patient_name}: {e}")
         return patient_name, None
 
+def summary_is_stale(store, patient_name: str, patient_folder: str) -> bool:
+    """True when the patient's documents differ from the ones its stored summary was built from."""
+    version = current_index_version(patient_name, patient_folder, hf_model_name)
+    stored = store.summary_fingerprints().get(patient_name, "")
+    if stored is None:
+        # Imported without a fingerprint: adopt the current documents as its baseline.
+        store.set_summary_fingerprint(patient_name, version)
+        return False
+    return stored != version
+
+async def summarize_patient(store, patient_name: str, patient_folder: str, llm: Optional[LLM] = None, index: Optional[VectorStoreIndex] = None) -> bool:
+    """Summarises one patient from `index` (loaded if not given) and saves it; returns whether it did."""
+    if index is None:
+        index = await asyncio.to_thread(load_patient_index, patient_name, patient_folder)
+    if index is None:
+        print(f"  - No readable documents found for {patient_name}, skipping summary.")
+        return False
+    version = stored_index_version(patient_name)
+    _, summary_data = await generate_summary_for_patient(patient_name, index, llm=llm)
+    if summary_data:
+        store.upsert_summary(patient_name, summary_data, fingerprint=version)
+    return summary_data is not None
+
+async def regenerate_summaries(store, data_root='data', concurrency: int = SUMMARY_CONCURRENCY, llm: Optional[LLM] = None):
+    """
+    Regenerates the summaries of patients whose document fingerprint differs
+    from the one stored with their summary, at most `concurrency` at a time.
+    Each summary is saved as soon as it is ready, so an interrupted run picks
+    up where it stopped. Summaries of patients whose folder is gone are removed.
+    """
+    folders = patient_folders(data_root)
+    dirty = {name: folder for name, folder in folders.items() if summary_is_stale(store, name, folder)}
+    for patient_name in store.summary_fingerprints():
+        if patient_name not in folders:
+            store.delete_summary(patient_name)
+    print(f"🧾 {len(dirty)} of {len(folders)} patients need a new summary.")
+
+    slots = asyncio.Semaphore(concurrency)
+    # Index builds are CPU-bound embedding work; run one at a time, off the event loop.
+    index_lock = asyncio.Lock()
+
+    async def regenerate(patient_name, patient_folder):
+        async with slots:
+            async with index_lock:
+                index = await asyncio.to_thread(load_patient_index, patient_name, patient_folder)
+            await summarize_patient(store, patient_name, patient_folder, llm, index)
+
+    await asyncio.gather(*(regenerate(name, folder) for name, folder in dirty.items()))
+
+def train_classifier(store) -> NearestCentroidClassifier:
+    classifier = train_from_manifest(store.load_manifest(), Settings.embed_model)
+    if classifier.trained:
+        print(f"🧠 Local classifier trained on {classifier.examples} documents ({', '.join(classifier.labels)})")
+    else:
+        print("⚠️ Not enough labelled documents for the local classifier, using the LLM for every file.")
+    return classifier
+
+@metrics.timed("classification")
+async def classify_patient_documents(store, patient_name: str, patient_folder: str, classifier: NearestCentroidClassifier, llm: LLM) -> Tuple[int, int]:
+    """
+    Classifies the patient's new or changed files (locally when confident,
+    otherwise with the LLM) and drops rows of files that are gone. Returns
+    how many were classified locally and by the LLM.
+    """
+    print(f"\nProcessing documents for: {patient_name}")
+    known = store.document_fingerprints(patient_name)
+    classification_tasks = []
+    files_to_process = []
+    present = set()
+    backfill = []
+    for filename in os.listdir(patient_folder):
+        filepath = os.path.join(patient_folder, filename)
+        if not (os.path.isfile(filepath) and filename.lower().endswith(('.pdf', '.txt'))):
+            continue
+        present.add(filepath)
+        stat = os.stat(filepath)
+        digest = file_digest(filepath)
+        if filepath in known and known[filepath] is None:
+            # Imported from the JSON manifest without a hash: keep its category, record the fingerprint.
+            backfill.append((filepath, digest, stat.st_size, stat.st_mtime_ns))
+            continue
+        if known.get(filepath) == digest:
+            continue
+        files_to_process.append({'filename': filename, 'path': filepath, 'sha256': digest,
+                                 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+    local_count = 0
+    if files_to_process:
+        texts = await asyncio.to_thread(read_documents, [doc_info['path'] for doc_info in files_to_process])
+        snippets = [document_snippet(texts.get(doc_info['path'], "")) for doc_info in files_to_process]
+        predictions = await asyncio.to_thread(classifier.predict, snippets)
+        categories = [None] * len(files_to_process)
+        for i, (category, confidence) in enumerate(predictions):
+            if classifier.confident(confidence):
+                categories[i] = category
+                local_count += 1
+                print(f"  - '{files_to_process[i]['filename']}' classified locally as: {category} ({confidence:.2f})")
+            else:
+                classification_tasks.append((i, classify_document(files_to_process[i]['path'], llm, snippets[i])))
+        if classification_tasks:
+            llm_categories = await asyncio.gather(*(task for _, task in classification_tasks))
+            for (i, _), category in zip(classification_tasks, llm_categories):
+                categories[i] = category
+        for doc_info, category in zip(files_to_process, categories):
+            store.upsert_document(patient_name, category=category, **doc_info)
+    store.set_fingerprints(backfill)
+    store.delete_documents([path for path in known if path not in present])
+    return local_count, len(classification_tasks)
+
+def forget_patient(store, patient_name: str):
+    """Removes the summary and document rows of a patient whose folder is gone."""
+    store.delete_summary(patient_name)
+    store.delete_documents(list(store.document_fingerprints(patient_name)))
+
 async def main():
     if not os.getenv("OPENROUTER_API_KEY"):
         print("FATAL ERROR: OPENROUTER_API_KEY environment variable not set.")
         return
 
+    setup_embeddings()
     llm = OpenRouterLLM()
     Settings.llm = llm
 
-    print("--- Starting Part 1: Generating Patient Summaries ---")
-    patient_indexes = load_all_patient_indexes()
-
-    if os.path.exists(SUMMARY_CACHE_FILE):
-        with open(SUMMARY_CACHE_FILE, 'r') as f:
-            summary_cache = json.load(f)
-    else:
-        summary_cache = {}
-
-    tasks = []
-    for name, index in patient_indexes.items():
-        if name not in summary_cache:
-            tasks.append(generate_summary_for_patient(name, index))
-    if tasks:
-        results = await asyncio.gather(*tasks)
-        for name, summary_data in results:
-            if summary_data:
-                summary_cache[name] = summary_data
-
-    with open(SUMMARY_CACHE_FILE, 'w') as f:
-        json.dump(summary_cache, f, indent=2)
+    store = get_patient_store()
 
-    print(f"✅ Part 1 complete. Summaries saved to {SUMMARY_CACHE_FILE}.")
+    print("--- Starting Part 1: Generating Patient Summaries ---")
+    await regenerate_summaries(store, llm=llm)
+    print(f"✅ Part 1 complete. Summaries saved to {store.path}.")
 
     print("\n--- Starting Part 2: Classifying Patient Documents ---")
-    if os.path.exists(DOCUMENT_MANIFEST_FILE):
-        with open(DOCUMENT_MANIFEST_FILE, 'r') as f:
-            document_manifest = json.load(f)
-    else:
-        document_manifest = {}
-
-    all_patients = os.listdir('data')
-
-    for patient_name_raw in all_patients:
-        patient_name = patient_name_raw.strip()
-        patient_folder = os.path.join('data', patient_name_raw)
-        if not os.path.isdir(patient_folder):
-            continue
-        if patient_name not in document_manifest:
-            document_manifest[patient_name] = []
-        print(f"\nProcessing documents for: {patient_name}")
-        processed_files = [doc['filename'] for doc in document_manifest[patient_name]]
-        classification_tasks = []
-        files_to_process = []
-        for filename in os.listdir(patient_folder):
-            if filename in processed_files:
-                continue
-            filepath = os.path.join(patient_folder, filename)
-            if os.path.isfile(filepath) and filename.lower().endswith(('.pdf', '.txt')):
-                classification_tasks.append(classify_document(filepath, llm))
-                files_to_process.append({'filename': filename, 'path': filepath})
-        if classification_tasks:
-            categories = await asyncio.gather(*classification_tasks)
-            for i, category in enumerate(categories):
-                doc_info = files_to_process[i]
-                document_manifest[patient_name].append({
-                    "filename": doc_info['filename'],
-                    "category": category,
-                    "path": doc_info['path']
-                })
-
-    with open(DOCUMENT_MANIFEST_FILE, 'w') as f:
-        json.dump(document_manifest, f, indent=2)
-
-    print(f"\n✅ Processing complete. Document manifest saved to {DOCUMENT_MANIFEST_FILE}.")
+    classifier = train_classifier(store)
+    local_count = 0
+    llm_count = 0
+    for patient_name, patient_folder in patient_folders('data').items():
+        local, remote = await classify_patient_documents(store, patient_name, patient_folder, classifier, llm)
+        local_count += local
+        llm_count += remote
+
+    print(f"\n✅ Processing complete. Document manifest saved to {store.path}.")
+    print(f"🏷️ Classified {local_count} documents locally and {llm_count} with the LLM.")
+    print(f"📡 LLM requests: {get_llm_client().stats()}")
+    metrics.report()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    run_sync(main())
@@ -0,0 +1,322 @@
+import os
+import json
+import shutil
+import fcntl
+import hashlib
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional, Union
+from llama_index.core import StorageContext, load_index_from_storage
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.vector_stores.simple import SimpleVectorStore
+from llama_index.core.indices.vector_store.base import VectorStoreIndex
+from llama_index.core.schema import Document
+from text_cache import file_digest
+from ingestion import ingest_config, prepare_documents, transformations
+from mmap_vector_store import DEFAULT_PERSIST_FNAME, MmapVectorStore
+from metrics import stage_timer
+
+INDEX_STORAGE_ROOT = 'index_storage'
+FINGERPRINT_FILE = 'fingerprint.json'
+FINGERPRINT_VERSION = 1
+SUPPORTED_EXTENSIONS = ('.pdf', '.txt')
+# 'float16' halves vector storage at a small cost in similarity precision.
+VECTOR_STORE_DTYPE = os.getenv("VECTOR_STORE_DTYPE", "float32")
+# Returned by update_document_in_index when no source file changed; the caller keeps whatever index it has.
+INDEX_UNCHANGED = object()
+
+# ------------------ Source fingerprints ------------------
+def list_source_files(patient_folder):
+    paths = []
+    for subdir, _, files in os.walk(patient_folder):
+        for file in files:
+            if file.lower().endswith(SUPPORTED_EXTENSIONS):
+                paths.append(os.path.join(subdir, file))
+    return sorted(paths)
+
+def compute_fingerprint(patient_folder, embedding_model: str, previous: Optional[Dict] = None) -> Dict:
+    """
+    Fingerprints every indexable file under `patient_folder` by path, size,
+    mtime and SHA-256. Hashes from `previous` are reused when size and mtime
+    are unchanged, so an untouched patient costs one stat() per file.
+    """
+    previous_files = (previous or {}).get('files', {})
+    files = {}
+    for path in list_source_files(patient_folder):
+        stat = os.stat(path)
+        entry = previous_files.get(path)
+        if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns:
+            sha256 = entry['sha256']
+        else:
+            sha256 = file_digest(path)
+        files[path] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': sha256}
+    return {
+        'version': FINGERPRINT_VERSION,
+        'embedding_model': embedding_model,
+        'ingest': ingest_config(),
+        'files': files,
+    }
+
+def fingerprint_matches(stored: Optional[Dict], current: Dict) -> bool:
+    """Two fingerprints match when the model, ingestion settings and every file's content hash agree; mtimes are ignored."""
+    if not stored:
+        return False
+    if stored.get('version') != current['version'] or stored.get('embedding_model') != current['embedding_model']:
+        return False
+    if stored.get('ingest') != current['ingest']:
+        return False
+    stored_hashes = {path: entry['sha256'] for path, entry in stored.get('files', {}).items()}
+    current_hashes = {path: entry['sha256'] for path, entry in current['files'].items()}
+    return stored_hashes == current_hashes
+
+def fingerprint_version(fingerprint: Dict) -> str:
+    """Short content-derived version of a fingerprint: equal source contents, model and ingestion settings give equal versions."""
+    digest = hashlib.sha256(fingerprint.get('embedding_model', '').encode('utf-8'))
+    digest.update(json.dumps(fingerprint.get('ingest'), sort_keys=True).encode('utf-8'))
+    for path, entry in sorted(fingerprint.get('files', {}).items()):
+        digest.update(f"\n{path}\0{entry['sha256']}".encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+def read_fingerprint(persist_dir) -> Optional[Dict]:
+    try:
+        with open(os.path.join(persist_dir, FINGERPRINT_FILE), 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def write_fingerprint(persist_dir, fingerprint: Dict):
+    path = os.path.join(persist_dir, FINGERPRINT_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(fingerprint, f, indent=2)
+    os.replace(tmp_path, path)
+
+# ------------------ Index persistence ------------------
+def new_storage_context() -> StorageContext:
+    return StorageContext.from_defaults(vector_store=MmapVectorStore(dtype=VECTOR_STORE_DTYPE))
+
+def load_vector_store(persist_dir) -> MmapVectorStore:
+    """Opens the memory-mapped store, converting a legacy JSON vector store in place the first time."""
+    if MmapVectorStore.exists(persist_dir):
+        return MmapVectorStore.from_persist_dir(persist_dir)
+    simple_store = SimpleVectorStore.from_persist_dir(persist_dir)
+    vector_store = MmapVectorStore.from_simple(simple_store, dtype=VECTOR_STORE_DTYPE)
+    vector_store.persist(os.path.join(persist_dir, DEFAULT_PERSIST_FNAME))
+    print(f"📦 Converted {os.path.join(persist_dir, DEFAULT_PERSIST_FNAME)} to a memory-mapped store")
+    return vector_store
+
+def load_persisted_index(persist_dir) -> VectorStoreIndex:
+    storage_context = StorageContext.from_defaults(
+        persist_dir=persist_dir,
+        vector_store=load_vector_store(persist_dir),
+    )
+    return load_index_from_storage(storage_context)
+
+def persist_index(index: Optional[VectorStoreIndex], persist_dir, fingerprint: Dict):
+    """
+    Writes the index files and then the fingerprint. The old fingerprint is
+    removed first, so a crash mid-write leaves a store that will be rebuilt
+    rather than one that looks current.
+    """
+    fingerprint_path = os.path.join(persist_dir, FINGERPRINT_FILE)
+    if index is None and os.path.isdir(persist_dir):
+        shutil.rmtree(persist_dir)
+    os.makedirs(persist_dir, exist_ok=True)
+    if os.path.exists(fingerprint_path):
+        os.remove(fingerprint_path)
+    if index is not None:
+        index.storage_context.persist(persist_dir=persist_dir)
+    write_fingerprint(persist_dir, dict(fingerprint, empty=index is None))
+
+def load_patient_documents(patient_folder) -> Dict[str, Document]:
+    """The patient's documents as they are indexed: boilerplate stripped, near-duplicates left out."""
+    documents, stats = prepare_documents(list_source_files(patient_folder))
+    duplicates = stats['near_duplicates']
+    if duplicates or stats['boilerplate_lines_removed']:
+        saved = 1 - stats['chars_after'] / stats['chars_before'] if stats['chars_before'] else 0.0
+        print(f"🧹 {os.path.basename(patient_folder.rstrip(os.sep))}: skipped {len(duplicates)} near-duplicate documents, "
+              f"stripped {stats['boilerplate_lines_removed']} boilerplate lines ({saved:.0%} less text)")
+        for duplicate, kept in sorted(duplicates.items()):
+            print(f"   {os.path.basename(duplicate)} ≈ {os.path.basename(kept)}")
+    return documents
+
+def build_patient_index(patient_folder) -> Optional[VectorStoreIndex]:
+    """Indexes every readable document under `patient_folder`; None when there are none."""
+    documents = list(load_patient_documents(patient_folder).values())
+    if not documents:
+        return None
+    # What VectorStoreIndex.from_documents does, split so chunking and embedding are timed apart.
+    storage_context = new_storage_context()
+    for document in documents:
+        storage_context.docstore.set_document_hash(document.id_, document.hash)
+    with stage_timer("chunking"):
+        nodes = run_transformations(documents, transformations())
+    with stage_timer("indexing"):
+        return VectorStoreIndex(nodes, storage_context=storage_context)
+
+def current_index_version(patient_name: str, patient_folder: str, embedding_model: str, storage_root: str = INDEX_STORAGE_ROOT) -> str:
+    """Version the patient's index has (or will have once rebuilt) for the files on disk now."""
+    stored = read_fingerprint(os.path.join(storage_root, patient_name))
+    return fingerprint_version(compute_fingerprint(patient_folder, embedding_model, previous=stored))
+
+def stored_index_version(patient_name: str, storage_root: str = INDEX_STORAGE_ROOT) -> Optional[str]:
+    fingerprint = read_fingerprint(os.path.join(storage_root, patient_name))
+    return fingerprint_version(fingerprint) if fingerprint else None
+
+def has_stored_documents(patient_name: str, storage_root: str = INDEX_STORAGE_ROOT) -> bool:
+    """Whether the patient's persisted index exists and holds at least one document."""
+    fingerprint = read_fingerprint(os.path.join(storage_root, patient_name))
+    return bool(fingerprint) and not fingerprint.get('empty')
+
+def remove_persisted_index(patient_name: str, storage_root: str = INDEX_STORAGE_ROOT):
+    persist_dir = os.path.join(storage_root, patient_name)
+    with patient_store_lock(patient_name, storage_root):
+        if os.path.isdir(persist_dir):
+            shutil.rmtree(persist_dir)
+
+@contextmanager
+def patient_store_lock(patient_name: str, storage_root: str = INDEX_STORAGE_ROOT):
+    """
+    Exclusive flock on the patient's lock file, held while its store is read,
+    built or rewritten. Serialises API workers and the summary generator, so
+    one process builds a missing index and the others then load it.
+    """
+    lock_dir = os.path.join(storage_root, '.locks')
+    os.makedirs(lock_dir, exist_ok=True)
+    with open(os.path.join(lock_dir, f"{patient_name}.lock"), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def load_or_build_index(
+    patient_name: str,
+    patient_folder: str,
+    build_index: Callable[[str], Optional[VectorStoreIndex]],
+    embedding_model: str,
+    storage_root: str = INDEX_STORAGE_ROOT,
+) -> Optional[VectorStoreIndex]:
+    """
+    Returns the patient's stored index when its fingerprint still matches the
+    source files, otherwise calls `build_index(patient_folder)` and persists
+    the result. Returns None for patients without readable documents.
+    """
+    with patient_store_lock(patient_name, storage_root):
+        return _load_or_build_index(patient_name, patient_folder, build_index, embedding_model, storage_root)
+
+def _load_or_build_index(patient_name, patient_folder, build_index, embedding_model, storage_root):
+    persist_dir = os.path.join(storage_root, patient_name)
+    stored = read_fingerprint(persist_dir)
+    current = compute_fingerprint(patient_folder, embedding_model, previous=stored)
+
+    if fingerprint_matches(stored, current):
+        try:
+            index = None if stored.get('empty') else load_persisted_index(persist_dir)
+            if current['files'] != stored['files']:
+                # Content is unchanged but mtimes moved; record them so the next boot skips hashing.
+                write_fingerprint(persist_dir, dict(current, empty=stored.get('empty', False)))
+            print(f"💾 Loaded stored index for {patient_name}")
+            return index
+        except Exception as e:
+            print(f"⚠️ Stored index for {patient_name} could not be loaded, rebuilding: {e}")
+    elif stored:
+        print(f"🔄 Source files changed for {patient_name}, rebuilding index")
+
+    index = build_index(patient_folder)
+    persist_index(index, persist_dir, current)
+    return index
+
+# ------------------ Incremental updates ------------------
+def _file_entry(file_path) -> Optional[Dict]:
+    if not os.path.isfile(file_path):
+        return None
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha256': file_digest(file_path)}
+
+def update_document_in_index(
+    patient_name: str,
+    patient_folder: str,
+    path: str,
+    build_index: Callable[[str], Optional[VectorStoreIndex]],
+    load_documents: Callable[[str], Dict[str, Document]],
+    embedding_model: str,
+    storage_root: str = INDEX_STORAGE_ROOT,
+) -> Union[VectorStoreIndex, None, object]:
+    """
+    Brings the nodes for `path` (a document, or a directory of documents) in
+    line with the file system. The change is applied to a private copy loaded
+    from storage and persisted before being returned, so the caller can swap
+    it in while readers keep using the index they have. Boilerplate and
+    near-duplicates are judged across the whole patient, so the prepared text
+    of untouched files can change too: every document whose prepared text no
+    longer matches the stored one is re-embedded (`load_documents(patient_folder)`
+    gives the documents to index), which leaves the same index a full build
+    would. Returns INDEX_UNCHANGED when no file under `path` changed, and
+    None once the patient has no documents left. Patients without a usable
+    store, or stored with other ingestion settings, fall back to
+    `load_or_build_index`.
+    """
+    with patient_store_lock(patient_name, storage_root):
+        return _update_document_in_index(
+            patient_name, patient_folder, path, build_index, load_documents, embedding_model, storage_root,
+        )
+
+def _update_document_in_index(patient_name, patient_folder, path, build_index, load_documents, embedding_model, storage_root):
+    persist_dir = os.path.join(storage_root, patient_name)
+    stored = read_fingerprint(persist_dir)
+    if not stored or stored.get('empty') or stored.get('embedding_model') != embedding_model or stored.get('ingest') != ingest_config():
+        return _load_or_build_index(patient_name, patient_folder, build_index, embedding_model, storage_root)
+
+    prefix = path + os.sep
+    affected = {p for p in stored['files'] if p == path or p.startswith(prefix)}
+    if os.path.isdir(path):
+        affected.update(list_source_files(path))
+    elif path.lower().endswith(SUPPORTED_EXTENSIONS):
+        affected.add(path)
+
+    files = dict(stored['files'])
+    changed = []
+    for file_path in sorted(affected):
+        entry = _file_entry(file_path)
+        old = files.get(file_path)
+        if entry == old or (entry and old and entry['sha256'] == old['sha256']):
+            continue
+        changed.append(file_path)
+        if entry:
+            files[file_path] = entry
+        else:
+            files.pop(file_path, None)
+    if not changed:
+        return INDEX_UNCHANGED
+
+    try:
+        index = load_persisted_index(persist_dir)
+    except Exception as e:
+        print(f"⚠️ Stored index for {patient_name} could not be loaded, rebuilding: {e}")
+        return _load_or_build_index(patient_name, patient_folder, build_index, embedding_model, storage_root)
+
+    documents = load_documents(patient_folder)
+    indexed = set(index.ref_doc_info)
+    to_insert = []
+    for file_path in sorted(indexed | set(documents)):
+        document = documents.get(file_path)
+        if document is not None and index.docstore.get_document_hash(file_path) == document.hash:
+            continue
+        if file_path in indexed:
+            index.delete_ref_doc(file_path, delete_from_docstore=True)
+        if document is not None:
+            to_insert.append(document)
+        print(f"🧩 Re-indexed {os.path.basename(file_path)} for {patient_name}")
+    if to_insert:
+        # What index.insert() does per document, with the chunks of every document embedded in one batch.
+        with stage_timer("chunking"):
+            nodes = run_transformations(to_insert, transformations())
+        with stage_timer("indexing"):
+            index.insert_nodes(nodes)
+        for document in to_insert:
+            index.docstore.set_document_hash(document.id_, document.hash)
+
+    if not index.ref_doc_info:
+        index = None
+    persist_index(index, persist_dir, dict(stored, files=files))
+    return index
@@ -0,0 +1,170 @@
+import os
+import re
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import Document, TransformComponent
+from text_extraction import extract_pdf_pages_many, read_text_file
+from metrics import timed
+
+# Chunk size and overlap in tokens. all-MiniLM-L6-v2 truncates its input at
+# 256 word pieces, so anything much past that in a chunk is never embedded.
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "256"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "32"))
+# A page-edge line (header/footer) is boilerplate once it appears on this many pages across the patient's documents.
+BOILERPLATE_MIN_PAGES = int(os.getenv("BOILERPLATE_MIN_PAGES", "3"))
+# Lines at least this long repeated anywhere that often (disclaimers, authorization paragraphs) are boilerplate too.
+BOILERPLATE_MIN_CHARS = int(os.getenv("BOILERPLATE_MIN_CHARS", "60"))
+# Lines at the top and bottom of each page treated as header/footer candidates.
+BOILERPLATE_EDGE_LINES = 3
+# Estimated Jaccard similarity above which a document is dropped as a near-duplicate of a longer one; above 1 disables.
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.9"))
+MINHASH_PERMUTATIONS = 64
+SHINGLE_WORDS = 5
+# Bump when the cleaning rules change, so stored indexes are rebuilt.
+INGEST_VERSION = 1
+
+_PAGE_NUMBER = re.compile(r"^(page\s*)?\d+\s*(of|/)\s*\d+$|^page\s*\d+$", re.IGNORECASE)
+_WORD = re.compile(r"\w+")
+_MINHASH_PRIME = np.uint64(4294967311)  # smallest prime above 2**32
+# Fixed seed: signatures must agree between processes and runs.
+_MINHASH_A, _MINHASH_B = np.random.RandomState(20240601).randint(1, 2**31 - 1, size=(2, MINHASH_PERMUTATIONS)).astype(np.uint64)
+
+def ingest_config() -> Dict:
+    """Settings that change what gets indexed; part of the index fingerprint."""
+    return {
+        'version': INGEST_VERSION,
+        'chunk_size': CHUNK_SIZE,
+        'chunk_overlap': CHUNK_OVERLAP,
+        'boilerplate_min_pages': BOILERPLATE_MIN_PAGES,
+        'boilerplate_min_chars': BOILERPLATE_MIN_CHARS,
+        'near_duplicate_threshold': NEAR_DUPLICATE_THRESHOLD,
+    }
+
+def transformations() -> List[TransformComponent]:
+    return [SentenceSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)]
+
+# ------------------ Boilerplate ------------------
+def _line_key(line: str) -> str:
+    return " ".join(line.split()).lower()
+
+def find_boilerplate(pages: Dict[str, List[str]]) -> set:
+    """
+    Keys of lines repeated across the patient's pages: short lines only when
+    they sit at a page edge (headers, footers), long ones anywhere.
+    """
+    edge_counts: Counter = Counter()
+    long_counts: Counter = Counter()
+    for doc_pages in pages.values():
+        for page in doc_pages:
+            lines = [key for key in map(_line_key, page.splitlines()) if key]
+            edges = set(lines[:BOILERPLATE_EDGE_LINES] + lines[-BOILERPLATE_EDGE_LINES:])
+            edge_counts.update(edges)
+            long_counts.update({key for key in lines if len(key) >= BOILERPLATE_MIN_CHARS})
+    return {key for counts in (edge_counts, long_counts) for key, n in counts.items() if n >= BOILERPLATE_MIN_PAGES}
+
+def _is_boilerplate(key: str, boilerplate: set) -> bool:
+    return key in boilerplate or bool(_PAGE_NUMBER.match(key))
+
+def content_text(doc_pages: List[str], boilerplate: set) -> str:
+    """The document's text with every boilerplate line removed."""
+    return "\n".join(
+        line for page in doc_pages for line in page.splitlines()
+        if not _is_boilerplate(_line_key(line), boilerplate)
+    )
+
+def strip_boilerplate(pages: Dict[str, List[str]], boilerplate: set) -> Tuple[Dict[str, str], int]:
+    """
+    Joins each document's pages, dropping page numbers and every boilerplate
+    line after its first occurrence for the patient (in path order), so the
+    text is still indexed once. Returns the texts and the lines removed.
+    """
+    seen = set()
+    texts = {}
+    removed = 0
+    for path in sorted(pages):
+        kept = []
+        for page in pages[path]:
+            for line in page.splitlines():
+                key = _line_key(line)
+                if _PAGE_NUMBER.match(key) or key in seen:
+                    removed += 1
+                    continue
+                if key in boilerplate:
+                    seen.add(key)
+                kept.append(line)
+        texts[path] = "\n".join(kept)
+    return texts, removed
+
+# ------------------ Near-duplicates ------------------
+def minhash(text: str) -> Optional[np.ndarray]:
+    """MinHash signature of the text's word shingles; None for texts without words."""
+    words = _WORD.findall(text.lower())
+    if not words:
+        return None
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    hashes = np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+    return ((hashes[:, None] * _MINHASH_A + _MINHASH_B) % _MINHASH_PRIME).min(axis=0)
+
+def find_near_duplicates(texts: Dict[str, str], threshold: float = NEAR_DUPLICATE_THRESHOLD) -> Dict[str, str]:
+    """
+    Maps each near-duplicate document to the one kept in its place, comparing
+    `texts` (boilerplate already removed, so shared letterheads don't make
+    unrelated notes look alike). Longer documents are kept first, so a copy
+    never displaces a fuller version.
+    """
+    duplicates: Dict[str, str] = {}
+    if threshold > 1:
+        return duplicates
+    kept_paths: List[str] = []
+    kept_signatures: List[np.ndarray] = []
+    for path in sorted(texts, key=lambda p: (-len(texts[p]), p)):
+        signature = minhash(texts[path])
+        if signature is None:
+            continue
+        if kept_signatures:
+            similarity = (np.stack(kept_signatures) == signature).mean(axis=1)
+            best = int(similarity.argmax())
+            if similarity[best] >= threshold:
+                duplicates[path] = kept_paths[best]
+                continue
+        kept_paths.append(path)
+        kept_signatures.append(signature)
+    return duplicates
+
+# ------------------ Pipeline ------------------
+def read_pages(paths: Iterable[str]) -> Dict[str, List[str]]:
+    """Page texts of every .pdf/.txt in `paths`; a text file is one page."""
+    pages = {}
+    pdf_paths = []
+    for path in paths:
+        ext = os.path.basename(path).lower().split('.')[-1]
+        if ext == 'txt':
+            pages[path] = [read_text_file(path)]
+        elif ext == 'pdf':
+            pdf_paths.append(path)
+    pages.update(extract_pdf_pages_many(pdf_paths))
+    return pages
+
+@timed("ingestion")
+def prepare_documents(paths: Iterable[str]) -> Tuple[Dict[str, Document], Dict]:
+    """
+    Reads a patient's documents and returns the ones worth indexing, cleaned
+    of boilerplate and with near-duplicates left out, plus counts of what was
+    dropped. Runs over the whole patient so repeats across files are seen.
+    """
+    pages = read_pages(paths)
+    boilerplate = find_boilerplate(pages)
+    duplicates = find_near_duplicates({path: content_text(doc_pages, boilerplate) for path, doc_pages in pages.items()})
+    texts, lines_removed = strip_boilerplate({path: p for path, p in pages.items() if path not in duplicates}, boilerplate)
+    documents = {path: Document(text=text, doc_id=path) for path, text in texts.items() if text.strip()}
+    stats = {
+        'documents': len(documents),
+        'near_duplicates': duplicates,
+        'boilerplate_lines_removed': lines_removed,
+        'chars_before': sum(len(page) for doc_pages in pages.values() for page in doc_pages),
+        'chars_after': sum(len(document.text) for document in documents.values()),
+    }
+    return documents, stats
@@ -0,0 +1,207 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+import aiohttp
+from metrics import LLM_REQUESTS, record_llm_tokens, stage_timer
+
+OPENROUTER_API_URL = os.getenv("OPENROUTER_API_URL", "https://openrouter.ai/api/v1/chat/completions")
+# Requests in flight at once, per event loop.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+# Sustained request rate and burst size of the token bucket (shared across loops).
+LLM_RATE_PER_SECOND = float(os.getenv("LLM_RATE_PER_SECOND", "5"))
+LLM_BURST = int(os.getenv("LLM_BURST", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "16"))
+
+RETRYABLE_STATUSES = {408, 429, 500, 502, 503, 504}
+
+class TokenBucket:
+    """
+    Token bucket that hands out reservations: `reserve()` takes a token (going
+    into debt if none is left) and returns how long the caller must wait for
+    it. Bookkeeping is under a thread lock, so one bucket can pace callers on
+    several event loops.
+    """
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    async def acquire(self):
+        delay = self.reserve()
+        if delay:
+            await asyncio.sleep(delay)
+
+def retry_after_seconds(value: Optional[str]) -> Optional[float]:
+    """Parses a Retry-After header given either as seconds or as an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class LLMRequestError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(f"LLM request failed with HTTP {status}: {message}")
+        self.status = status
+
+class PooledHTTPClient:
+    """
+    Keep-alive JSON client for LLM APIs: one aiohttp session with a bounded
+    connection pool per event loop, a semaphore capping requests in flight,
+    a shared token bucket pacing request starts, and retries with full-jitter
+    exponential backoff on 429/5xx and connection errors. A Retry-After from
+    the server takes precedence over the computed backoff.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        rate_per_second: float = LLM_RATE_PER_SECOND,
+        burst: int = LLM_BURST,
+        max_retries: int = LLM_MAX_RETRIES,
+        backoff_base: float = LLM_BACKOFF_BASE,
+        backoff_max: float = LLM_BACKOFF_MAX,
+        timeout: float = LLM_TIMEOUT_SECONDS,
+        pool_size: int = LLM_POOL_SIZE,
+        provider: str = "openrouter",
+    ):
+        self.provider = provider
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.pool_size = pool_size
+        self.bucket = TokenBucket(rate_per_second, burst)
+        self._loops: Dict[asyncio.AbstractEventLoop, tuple] = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.retries = 0
+        self.throttled = 0
+        self.failures = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+
+    def _state(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._loops.get(loop)
+            if state is None or state[0].closed:
+                session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(limit=self.pool_size, keepalive_timeout=60),
+                    timeout=aiohttp.ClientTimeout(total=self.timeout),
+                )
+                state = (session, asyncio.Semaphore(self.max_concurrency))
+                self._loops[loop] = state
+            return state
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def post_json(self, url: str, payload: Dict, headers: Optional[Dict] = None) -> Dict:
+        with stage_timer(f"llm_{self.provider}"):
+            return await self._post_json(url, payload, headers)
+
+    async def _post_json(self, url: str, payload: Dict, headers: Optional[Dict]) -> Dict:
+        session, slots = self._state()
+        attempt = 0
+        while True:
+            async with slots:
+                await self.bucket.acquire()
+                self.requests += 1
+                try:
+                    async with session.post(url, json=payload, headers=headers) as resp:
+                        if resp.status < 400:
+                            data = await resp.json(content_type=None)
+                            usage = data.get("usage") if isinstance(data, dict) else None
+                            if usage:
+                                self.prompt_tokens += usage.get("prompt_tokens") or 0
+                                self.completion_tokens += usage.get("completion_tokens") or 0
+                                record_llm_tokens(self.provider, usage.get("prompt_tokens") or 0, usage.get("completion_tokens") or 0)
+                            LLM_REQUESTS.labels(self.provider, "ok").inc()
+                            return data
+                        body = await resp.text()
+                        if resp.status not in RETRYABLE_STATUSES or attempt >= self.max_retries:
+                            self.failures += 1
+                            LLM_REQUESTS.labels(self.provider, "error").inc()
+                            raise LLMRequestError(resp.status, body[:500])
+                        LLM_REQUESTS.labels(self.provider, "throttled" if resp.status == 429 else "retried").inc()
+                        if resp.status == 429:
+                            self.throttled += 1
+                        delay = retry_after_seconds(resp.headers.get("Retry-After"))
+                        reason = f"HTTP {resp.status}"
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                    if attempt >= self.max_retries:
+                        self.failures += 1
+                        LLM_REQUESTS.labels(self.provider, "error").inc()
+                        raise
+                    LLM_REQUESTS.labels(self.provider, "retried").inc()
+                    delay = None
+                    reason = type(e).__name__
+            # Back off outside the semaphore so other requests can use the slot.
+            delay = self._backoff(attempt) if delay is None else min(delay, self.backoff_max)
+            attempt += 1
+            self.retries += 1
+            print(f"⏳ LLM request got {reason}, retry {attempt}/{self.max_retries} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+    async def aclose(self):
+        """Closes the session belonging to the running event loop."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._loops.pop(loop, None)
+        if state is not None:
+            await state[0].close()
+
+    def stats(self) -> Dict:
+        return {
+            "requests": self.requests,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "failures": self.failures,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+        }
+
+_default_client: Optional[PooledHTTPClient] = None
+
+def get_llm_client() -> PooledHTTPClient:
+    global _default_client
+    if _default_client is None:
+        _default_client = PooledHTTPClient()
+    return _default_client
+
+def run_sync(coro):
+    """Runs `coro` on a fresh event loop and closes that loop's session afterwards."""
+    async def runner():
+        try:
+            return await coro
+        finally:
+            await get_llm_client().aclose()
+    return asyncio.run(runner())
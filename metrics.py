@@ -0,0 +1,121 @@
+import os
+import time
+import asyncio
+import functools
+from contextlib import contextmanager
+from typing import Dict
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest, write_to_textfile
+from prometheus_client.core import GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+
+# Prometheus textfile the batch scripts write their metrics to on exit (for node_exporter's textfile collector).
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE")
+# Set (to an empty directory, before start) when running several uvicorn workers, so /metrics adds up all of them.
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+STAGE_SECONDS = Histogram(
+    "patient_chat_stage_seconds",
+    "Time spent in each pipeline stage (extraction, chunking, embedding, retrieval, llm_*, ...)",
+    ["stage"],
+    buckets=STAGE_BUCKETS,
+)
+LLM_TOKENS = Counter("patient_chat_llm_tokens_total", "Tokens reported by LLM APIs", ["provider", "kind"])
+LLM_REQUESTS = Counter("patient_chat_llm_requests_total", "LLM HTTP requests by outcome", ["provider", "outcome"])
+CACHE_LOOKUPS = Counter("patient_chat_cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"])
+
+class CacheHitRatioCollector:
+    """
+    Exposes hits / (hits + misses) per cache, derived at scrape time from
+    CACHE_LOOKUPS in `source` (this process, or every worker's collector).
+    """
+
+    def __init__(self, source=CACHE_LOOKUPS):
+        self.source = source
+
+    def collect(self):
+        totals: Dict[str, Dict[str, float]] = {}
+        for metric in self.source.collect():
+            for sample in metric.samples:
+                if sample.name == "patient_chat_cache_lookups_total":
+                    counts = totals.setdefault(sample.labels["cache"], {})
+                    counts[sample.labels["result"]] = sample.value
+        gauge = GaugeMetricFamily("patient_chat_cache_hit_ratio", "Lifetime cache hit ratio", labels=["cache"])
+        for cache, counts in sorted(totals.items()):
+            lookups = sum(counts.values())
+            gauge.add_metric([cache], counts.get("hit", 0.0) / lookups if lookups else 0.0)
+        yield gauge
+
+REGISTRY.register(CacheHitRatioCollector())
+
+def observe_stage(stage: str, seconds: float):
+    STAGE_SECONDS.labels(stage).observe(seconds)
+
+@contextmanager
+def stage_timer(stage: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+def timed(stage: str):
+    """Decorator form of stage_timer for plain and async functions."""
+    def decorate(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with stage_timer(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def record_cache(cache: str, hits: int = 0, misses: int = 0):
+    if hits:
+        CACHE_LOOKUPS.labels(cache, "hit").inc(hits)
+    if misses:
+        CACHE_LOOKUPS.labels(cache, "miss").inc(misses)
+
+def record_llm_tokens(provider: str, prompt_tokens: int = 0, completion_tokens: int = 0):
+    if prompt_tokens:
+        LLM_TOKENS.labels(provider, "prompt").inc(prompt_tokens)
+    if completion_tokens:
+        LLM_TOKENS.labels(provider, "completion").inc(completion_tokens)
+
+def render_latest():
+    """Body and content type for a /metrics response, summed over all workers in multiprocess mode."""
+    if not PROMETHEUS_MULTIPROC_DIR:
+        return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
+    registry = CollectorRegistry()
+    workers = MultiProcessCollector(registry)
+    registry.register(CacheHitRatioCollector(workers))
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def stage_summary() -> Dict[str, Dict[str, float]]:
+    """Count, total and mean seconds per stage observed so far in this process."""
+    summary: Dict[str, Dict[str, float]] = {}
+    for metric in STAGE_SECONDS.collect():
+        for sample in metric.samples:
+            stage = sample.labels.get("stage")
+            if sample.name.endswith("_count"):
+                summary.setdefault(stage, {})["count"] = sample.value
+            elif sample.name.endswith("_sum"):
+                summary.setdefault(stage, {})["total_s"] = sample.value
+    for stats in summary.values():
+        stats["mean_s"] = stats["total_s"] / stats["count"] if stats.get("count") else 0.0
+    return summary
+
+def report(path: str = METRICS_TEXTFILE):
+    """Prints the per-stage timings and, when `path` is set, writes every metric to it in Prometheus text format."""
+    for stage, stats in sorted(stage_summary().items(), key=lambda item: -item[1].get("total_s", 0.0)):
+        print(f"⏱️ {stage:<18} {int(stats['count']):>6} calls  {stats['total_s']:8.2f}s total  {stats['mean_s'] * 1000:8.1f}ms mean")
+    if path:
+        write_to_textfile(path, REGISTRY)
+        print(f"📈 Metrics written to {path}")
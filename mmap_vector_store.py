@@ -0,0 +1,207 @@
+import os
+import glob
+import json
+import uuid
+from typing import Any, List, Optional, Sequence
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode
+from llama_index.core.vector_stores.simple import SimpleVectorStore
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+
+DEFAULT_PERSIST_FNAME = 'default__vector_store.json'
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """
+    Vector store that keeps all embeddings of an index in one contiguous
+    float32 (or float16) matrix. Persisted stores are reopened with
+    np.load(mmap_mode='r'), so loading costs no parsing and the pages are
+    shared between processes; queries are a single vectorized cosine
+    similarity over the matrix. Nodes themselves stay in the docstore, as
+    with SimpleVectorStore.
+
+    On disk, `<name>.meta.json` lists node ids and ref doc ids and names the
+    `<name>.<token>.npy` matrix it belongs to. A new matrix file is written
+    before the metadata is swapped in, so readers never pair old ids with a
+    new matrix.
+    """
+
+    stores_text: bool = False
+    dtype: str = 'float32'
+
+    _ids: List[str] = PrivateAttr(default_factory=list)
+    _ref_doc_ids: List[str] = PrivateAttr(default_factory=list)
+    _matrix: Optional[np.ndarray] = PrivateAttr(default=None)
+    _norms: Optional[np.ndarray] = PrivateAttr(default=None)
+
+    def __init__(self, dtype: str = 'float32', **kwargs: Any):
+        if dtype not in ('float32', 'float16'):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        super().__init__(dtype=dtype, **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MmapVectorStore"
+
+    @property
+    def client(self) -> None:
+        return None
+
+    @property
+    def nbytes(self) -> int:
+        return 0 if self._matrix is None else int(self._matrix.nbytes)
+
+    @property
+    def node_count(self) -> int:
+        return len(self._ids)
+
+    def _set(self, ids: List[str], ref_doc_ids: List[str], matrix: Optional[np.ndarray]):
+        self._ids = ids
+        self._ref_doc_ids = ref_doc_ids
+        self._matrix = matrix if ids else None
+        self._norms = None
+
+    def _keep(self, mask: np.ndarray):
+        if mask.all():
+            return
+        ids = [node_id for node_id, keep in zip(self._ids, mask) if keep]
+        ref_doc_ids = [ref for ref, keep in zip(self._ref_doc_ids, mask) if keep]
+        self._set(ids, ref_doc_ids, np.ascontiguousarray(self._matrix[mask]) if ids else None)
+
+    # ------------------ Mutations ------------------
+    def add(self, nodes: Sequence[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        new_ids = [node.node_id for node in nodes]
+        if self._ids:
+            replaced = set(new_ids)
+            self._keep(np.array([node_id not in replaced for node_id in self._ids], dtype=bool))
+        vectors = np.asarray([node.get_embedding() for node in nodes], dtype=self.dtype)
+        matrix = vectors if self._matrix is None else np.vstack([self._matrix, vectors])
+        self._set(
+            self._ids + new_ids,
+            self._ref_doc_ids + [node.ref_doc_id or "None" for node in nodes],
+            matrix,
+        )
+        return new_ids
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        self._keep(np.array([ref != ref_doc_id for ref in self._ref_doc_ids], dtype=bool))
+
+    def delete_nodes(self, node_ids: Optional[List[str]] = None, filters: Optional[Any] = None, **delete_kwargs: Any) -> None:
+        if filters is not None:
+            raise ValueError("MmapVectorStore does not support metadata filters")
+        if node_ids is None:
+            return
+        doomed = set(node_ids)
+        self._keep(np.array([node_id not in doomed for node_id in self._ids], dtype=bool))
+
+    def clear(self) -> None:
+        self._set([], [], None)
+
+    def get(self, text_id: str) -> List[float]:
+        return self._matrix[self._ids.index(text_id)].astype(np.float32).tolist()
+
+    # ------------------ Query ------------------
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.filters is not None:
+            raise ValueError("MmapVectorStore does not support metadata filters")
+        if query.mode != VectorStoreQueryMode.DEFAULT:
+            raise ValueError(f"Invalid query mode: {query.mode}")
+        if not self._ids or query.query_embedding is None:
+            return VectorStoreQueryResult(similarities=[], ids=[])
+
+        if self._norms is None:
+            self._norms = np.linalg.norm(self._matrix.astype(np.float32, copy=False), axis=1)
+        q = np.asarray(query.query_embedding, dtype=np.float32)
+        denominator = self._norms * (np.linalg.norm(q) or 1.0)
+        scores = self._matrix.astype(np.float32, copy=False) @ q
+        scores = np.divide(scores, denominator, out=np.zeros_like(scores), where=denominator > 0)
+
+        if query.node_ids is not None or query.doc_ids is not None:
+            node_ids = set(query.node_ids) if query.node_ids is not None else None
+            doc_ids = set(query.doc_ids) if query.doc_ids is not None else None
+            allowed = np.array([
+                (node_ids is None or node_id in node_ids) and (doc_ids is None or ref in doc_ids)
+                for node_id, ref in zip(self._ids, self._ref_doc_ids)
+            ], dtype=bool)
+            scores = np.where(allowed, scores, -np.inf)
+
+        k = min(query.similarity_top_k, len(self._ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        top = [i for i in top if np.isfinite(scores[i])]
+        return VectorStoreQueryResult(
+            similarities=[float(scores[i]) for i in top],
+            ids=[self._ids[i] for i in top],
+        )
+
+    # ------------------ Persistence ------------------
+    @staticmethod
+    def _base_path(persist_path: str) -> str:
+        return persist_path[:-len('.json')] if persist_path.endswith('.json') else persist_path
+
+    def persist(self, persist_path: str, fs: Optional[Any] = None) -> None:
+        base = self._base_path(persist_path)
+        directory = os.path.dirname(base) or '.'
+        os.makedirs(directory, exist_ok=True)
+        matrix = self._matrix if self._matrix is not None else np.zeros((0, 0), dtype=self.dtype)
+        matrix_name = f"{os.path.basename(base)}.{uuid.uuid4().hex[:12]}.npy"
+        with open(os.path.join(directory, matrix_name), 'wb') as f:
+            np.save(f, np.ascontiguousarray(matrix, dtype=self.dtype))
+        meta = {
+            'version': 1,
+            'matrix': matrix_name,
+            'dtype': self.dtype,
+            'ids': self._ids,
+            'ref_doc_ids': self._ref_doc_ids,
+        }
+        meta_path = f"{base}.meta.json"
+        with open(meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(meta_path + '.tmp', meta_path)
+        # Old matrices can go now; processes that still map them keep their open inode.
+        for stale in glob.glob(f"{glob.escape(base)}.*.npy"):
+            if os.path.basename(stale) != matrix_name:
+                os.remove(stale)
+        if os.path.exists(persist_path) and persist_path != meta_path:
+            os.remove(persist_path)
+
+    @classmethod
+    def exists(cls, persist_dir: str, fname: str = DEFAULT_PERSIST_FNAME) -> bool:
+        return os.path.exists(f"{cls._base_path(os.path.join(persist_dir, fname))}.meta.json")
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str, fname: str = DEFAULT_PERSIST_FNAME, attempts: int = 3) -> "MmapVectorStore":
+        base = cls._base_path(os.path.join(persist_dir, fname))
+        for attempt in range(attempts):
+            with open(f"{base}.meta.json", 'r') as f:
+                meta = json.load(f)
+            store = cls(dtype=meta['dtype'])
+            if not meta['ids']:
+                return store
+            try:
+                matrix = np.load(os.path.join(os.path.dirname(base), meta['matrix']), mmap_mode='r')
+            except FileNotFoundError:
+                # A writer replaced the store between reading the metadata and the matrix.
+                if attempt == attempts - 1:
+                    raise
+                continue
+            store._set(meta['ids'], meta['ref_doc_ids'], matrix)
+            return store
+
+    @classmethod
+    def from_simple(cls, simple_store: SimpleVectorStore, dtype: str = 'float32') -> "MmapVectorStore":
+        """Converts a JSON SimpleVectorStore without re-embedding anything."""
+        data = simple_store.data
+        ids = list(data.embedding_dict)
+        store = cls(dtype=dtype)
+        if ids:
+            matrix = np.asarray([data.embedding_dict[node_id] for node_id in ids], dtype=dtype)
+            store._set(ids, [data.text_id_to_ref_doc_id.get(node_id, "None") for node_id in ids], matrix)
+        return store
@@ -0,0 +1,134 @@
+"""
+Offline stand-in for the OpenRouter chat completions API and the Gemini
+generateContent / streamGenerateContent endpoints used by app.py.
+
+    python mock_llm_server.py --port 8089 --latency 0.2 --rate-limit 5
+    OPENROUTER_API_KEY=test OPENROUTER_API_URL=http://127.0.0.1:8089/api/v1/chat/completions python generate_summaries.py
+    GEMINI_BASE_URL=http://127.0.0.1:8089 uvicorn app:app
+
+Classification prompts are answered with a valid category, JSON-mode
+requests with the three summary sections, and anything else with a canned
+summary. Gemini requests get a canned answer, streamed in a few chunks
+when asked for server-sent events. --rate-limit answers 429 with Retry-After once the
+per-second budget is spent, and --error-rate injects random 503s, so the
+client's throttling and retry paths can be exercised without network access.
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+from aiohttp import web
+
+def build_app(latency: float = 0.0, rate_limit: float = 0.0, error_rate: float = 0.0) -> web.Application:
+    stats = {"requests": 0, "gemini_requests": 0, "throttled": 0, "errors": 0, "connections": set()}
+    window = {"start": time.monotonic(), "count": 0}
+
+    def refuse(request: web.Request):
+        """Counts the connection, then applies the rate limit and error injection; returns an error response or None."""
+        peer = request.transport.get_extra_info("peername") if request.transport else None
+        stats["connections"].add(peer)
+        if rate_limit > 0:
+            now = time.monotonic()
+            if now - window["start"] >= 1.0:
+                window["start"], window["count"] = now, 0
+            window["count"] += 1
+            if window["count"] > rate_limit:
+                stats["throttled"] += 1
+                retry_after = max(0.0, 1.0 - (now - window["start"]))
+                return web.json_response(
+                    {"error": {"message": "Rate limit exceeded"}},
+                    status=429,
+                    headers={"Retry-After": f"{retry_after:.2f}"},
+                )
+        if error_rate > 0 and random.random() < error_rate:
+            stats["errors"] += 1
+            return web.json_response({"error": {"message": "Upstream unavailable"}}, status=503)
+        return None
+
+    async def chat_completions(request: web.Request) -> web.Response:
+        stats["requests"] += 1
+        refused = refuse(request)
+        if refused is not None:
+            return refused
+
+        payload = await request.json()
+        prompt = payload["messages"][-1]["content"] if payload.get("messages") else ""
+        if latency:
+            await asyncio.sleep(latency)
+        if (payload.get("response_format") or {}).get("type") == "json_object":
+            content = json.dumps({
+                "medication_summary": "Mock medication summary.",
+                "lifestyle_recommendations": "Mock lifestyle recommendations.",
+                "condition_summary": "Mock condition summary.",
+            })
+        elif "classify" in prompt.lower():
+            content = "Clinical Note"
+        else:
+            content = "Mock summary generated offline for testing."
+        return web.json_response({
+            "id": f"mock-{stats['requests']}",
+            "object": "chat.completion",
+            "model": payload.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4},
+        })
+
+    async def gemini_generate(request: web.Request) -> web.StreamResponse:
+        stats["gemini_requests"] += 1
+        refused = refuse(request)
+        if refused is not None:
+            return refused
+        model, _, method = request.match_info["model_method"].partition(":")
+        payload = await request.json()
+        prompt = "".join(
+            part.get("text", "") for content in payload.get("contents", []) for part in content.get("parts", [])
+        )
+        answer = f"Mock answer from {model} based on {len(prompt)} characters of patient context."
+        usage = {"promptTokenCount": len(prompt) // 4, "candidatesTokenCount": len(answer) // 4}
+        if latency:
+            await asyncio.sleep(latency)
+        if method != "streamGenerateContent":
+            return web.json_response({
+                "candidates": [{"content": {"role": "model", "parts": [{"text": answer}]}, "finishReason": "STOP"}],
+                "usageMetadata": usage,
+            })
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        words = answer.split(" ")
+        chunks = [" ".join(words[i:i + 4]) + " " for i in range(0, len(words), 4)]
+        for i, chunk in enumerate(chunks):
+            event = {"candidates": [{"content": {"role": "model", "parts": [{"text": chunk}]}}]}
+            if i == len(chunks) - 1:
+                event["candidates"][0]["finishReason"] = "STOP"
+                event["usageMetadata"] = usage
+            await response.write(f"data: {json.dumps(event)}\r\n\r\n".encode())
+            await asyncio.sleep(0.01)
+        await response.write_eof()
+        return response
+
+    async def get_stats(request: web.Request) -> web.Response:
+        return web.json_response({
+            "requests": stats["requests"],
+            "gemini_requests": stats["gemini_requests"],
+            "throttled": stats["throttled"],
+            "errors": stats["errors"],
+            "connections": len(stats["connections"]),
+        })
+
+    app = web.Application()
+    app.router.add_post("/api/v1/chat/completions", chat_completions)
+    app.router.add_post("/{version}/models/{model_method}", gemini_generate)
+    app.router.add_get("/stats", get_stats)
+    return app
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock OpenRouter and Gemini server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before answering")
+    parser.add_argument("--rate-limit", type=float, default=0.0, help="Requests per second before 429s (0 = unlimited)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with 503")
+    args = parser.parse_args()
+    print(f"🧪 Mock LLM server on http://{args.host}:{args.port} (OpenRouter: /api/v1/chat/completions, Gemini: /v1beta/models/...)")
+    web.run_app(build_app(args.latency, args.rate_limit, args.error_rate), host=args.host, port=args.port, print=None)
@@ -0,0 +1,156 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple
+from llama_index.core.indices.vector_store.base import VectorStoreIndex
+from metrics import record_cache, stage_timer
+
+INDEX_CACHE_MAX_ENTRIES = int(os.getenv("INDEX_CACHE_MAX_ENTRIES", "32"))
+INDEX_CACHE_MAX_BYTES = int(os.getenv("INDEX_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+# Rough per-node overhead of the docstore objects on top of their text.
+NODE_OVERHEAD_BYTES = 2048
+
+def estimate_index_bytes(index: VectorStoreIndex) -> int:
+    """Approximate resident size of an index: its vector matrix plus docstore text and per-node overhead."""
+    vector_bytes = getattr(index.vector_store, 'nbytes', 0)
+    docs = index.docstore.docs
+    text_bytes = sum(len(node.get_content()) for node in docs.values())
+    return vector_bytes + text_bytes + NODE_OVERHEAD_BYTES * len(docs)
+
+class PatientIndexCache:
+    """
+    LRU of patient indexes, loaded on first use through `loader(patient_name)`
+    and evicted once either `max_entries` or the estimated `max_bytes` is
+    exceeded. Concurrent misses for the same patient wait on a single load.
+    When `versioner` is given, each resident index remembers the version it
+    returned at load/put time (see `version()`).
+    """
+
+    def __init__(
+        self,
+        loader: Callable[[str], Optional[VectorStoreIndex]],
+        max_entries: int = INDEX_CACHE_MAX_ENTRIES,
+        max_bytes: int = INDEX_CACHE_MAX_BYTES,
+        versioner: Optional[Callable[[str], Optional[str]]] = None,
+    ):
+        self._loader = loader
+        self._versioner = versioner
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, Tuple[VectorStoreIndex, int, Optional[str]]]" = OrderedDict()
+        self._loading: Dict[str, Future] = {}
+        self._generations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.loads = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, patient_name: str) -> bool:
+        return patient_name in self._entries
+
+    def resident(self) -> List[str]:
+        with self._lock:
+            return list(self._entries)
+
+    def peek(self, patient_name: str) -> Optional[VectorStoreIndex]:
+        """Returns the resident index without loading it or touching LRU order and counters."""
+        entry = self._entries.get(patient_name)
+        return entry[0] if entry else None
+
+    def version(self, patient_name: str) -> Optional[str]:
+        entry = self._entries.get(patient_name)
+        return entry[2] if entry else None
+
+    def get(self, patient_name: str) -> Optional[VectorStoreIndex]:
+        with self._lock:
+            entry = self._entries.get(patient_name)
+            if entry:
+                self._entries.move_to_end(patient_name)
+                self.hits += 1
+                record_cache("index", hits=1)
+                return entry[0]
+            self.misses += 1
+            record_cache("index", misses=1)
+            future = self._loading.get(patient_name)
+            if future is not None:
+                owner = False
+            else:
+                owner = True
+                future = Future()
+                self._loading[patient_name] = future
+                generation = self._generations.get(patient_name, 0)
+                self.loads += 1
+        if not owner:
+            return future.result()
+
+        try:
+            with stage_timer("index_load"):
+                index = self._loader(patient_name)
+        except BaseException as e:
+            with self._lock:
+                self._loading.pop(patient_name, None)
+            future.set_exception(e)
+            raise
+        with self._lock:
+            self._loading.pop(patient_name, None)
+            if self._generations.get(patient_name, 0) != generation:
+                # A put() or discard() during the load carries newer state than what we read.
+                newer = self._entries.get(patient_name)
+                index = newer[0] if newer else None
+            elif index is not None:
+                self._store(patient_name, index)
+        future.set_result(index)
+        return index
+
+    def put(self, patient_name: str, index: VectorStoreIndex):
+        with self._lock:
+            self._generations[patient_name] = self._generations.get(patient_name, 0) + 1
+            self._store(patient_name, index)
+
+    def replace_if_resident(self, patient_name: str, index: VectorStoreIndex):
+        """Swaps in a newer index for a resident (or loading) patient; cold patients stay unloaded."""
+        with self._lock:
+            self._generations[patient_name] = self._generations.get(patient_name, 0) + 1
+            if patient_name in self._entries or patient_name in self._loading:
+                self._store(patient_name, index)
+
+    def discard(self, patient_name: str):
+        with self._lock:
+            self._generations[patient_name] = self._generations.get(patient_name, 0) + 1
+            entry = self._entries.pop(patient_name, None)
+            if entry:
+                self.bytes -= entry[1]
+
+    def _store(self, patient_name: str, index: VectorStoreIndex):
+        size = estimate_index_bytes(index)
+        version = self._versioner(patient_name) if self._versioner else None
+        old = self._entries.pop(patient_name, None)
+        if old:
+            self.bytes -= old[1]
+        self._entries[patient_name] = (index, size, version)
+        self.bytes += size
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self.bytes > self.max_bytes):
+            evicted_name, (_, evicted_size, _) = self._entries.popitem(last=False)
+            self.bytes -= evicted_size
+            self.evictions += 1
+            print(f"♻️ Evicted index for {evicted_name} from memory")
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "resident": len(self._entries),
+            "resident_bytes": self.bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "loads": self.loads,
+        }
@@ -0,0 +1,319 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+PATIENT_STORE_PATH = os.getenv("PATIENT_STORE_PATH", "patient_store.db")
+SUMMARY_CACHE_FILE = 'patient_summary_cache.json'
+DOCUMENT_MANIFEST_FILE = 'document_manifest.json'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS summaries (
+    patient_name TEXT PRIMARY KEY,
+    data TEXT,
+    rev INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS documents (
+    path TEXT PRIMARY KEY,
+    patient_name TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    category TEXT,
+    sha256 TEXT,
+    size INTEGER,
+    mtime_ns INTEGER,
+    rev INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS documents_by_patient ON documents(patient_name);
+CREATE INDEX IF NOT EXISTS documents_by_rev ON documents(rev);
+CREATE INDEX IF NOT EXISTS summaries_by_rev ON summaries(rev);
+"""
+
+# Applied in order on top of SCHEMA; PRAGMA user_version records how many have run.
+MIGRATIONS = [
+    # Fingerprint of the documents a summary was generated from.
+    "ALTER TABLE summaries ADD COLUMN fingerprint TEXT",
+]
+
+class PatientStore:
+    """
+    SQLite store (WAL mode) for patient summaries, document classifications
+    and per-document fingerprints. Every write bumps a store-wide revision
+    and stamps the rows it touches, so a reader can fetch only the rows
+    changed since the revision it last saw (`changes_since`). Deletions are
+    soft, so they show up in that delta too. Each thread gets its own
+    connection.
+    """
+
+    def __init__(self, path: str = PATIENT_STORE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self.conn.executescript(SCHEMA)
+        self.conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('rev', '0')")
+        self._migrate()
+
+    def _migrate(self):
+        with self._write() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            for statement in MIGRATIONS[version:]:
+                conn.execute(statement)
+            if version < len(MIGRATIONS):
+                conn.execute(f"PRAGMA user_version = {len(MIGRATIONS)}")
+
+    @property
+    def conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+    # ------------------ Transactions ------------------
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        """Write transaction; IMMEDIATE takes the write lock up front so the revision bump cannot race."""
+        conn = self.conn
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def _next_rev(conn: sqlite3.Connection) -> int:
+        conn.execute("UPDATE meta SET value = CAST(value AS INTEGER) + 1 WHERE key = 'rev'")
+        return int(conn.execute("SELECT value FROM meta WHERE key = 'rev'").fetchone()[0])
+
+    def current_rev(self) -> int:
+        return int(self.conn.execute("SELECT value FROM meta WHERE key = 'rev'").fetchone()[0])
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key: str, value: str):
+        with self._write() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    # ------------------ Summaries ------------------
+    def upsert_summary(self, patient_name: str, summary: Dict, fingerprint: Optional[str] = None):
+        with self._write() as conn:
+            self._upsert_summary(conn, self._next_rev(conn), patient_name, summary, fingerprint)
+
+    @staticmethod
+    def _upsert_summary(conn, rev: int, patient_name: str, summary: Dict, fingerprint: Optional[str] = None):
+        conn.execute(
+            """INSERT INTO summaries (patient_name, data, fingerprint, rev, updated_at, deleted) VALUES (?, ?, ?, ?, ?, 0)
+               ON CONFLICT(patient_name) DO UPDATE SET
+                   data = excluded.data, fingerprint = excluded.fingerprint, rev = excluded.rev,
+                   updated_at = excluded.updated_at, deleted = 0""",
+            (patient_name, json.dumps(summary), fingerprint, rev, time.time()),
+        )
+
+    def summary_fingerprints(self) -> Dict[str, Optional[str]]:
+        """Patient name -> fingerprint of the documents its live summary was built from."""
+        rows = self.conn.execute("SELECT patient_name, fingerprint FROM summaries WHERE deleted = 0")
+        return {row['patient_name']: row['fingerprint'] for row in rows}
+
+    def set_summary_fingerprint(self, patient_name: str, fingerprint: str):
+        """Records a fingerprint without touching the summary, so the revision stays."""
+        with self._write() as conn:
+            conn.execute("UPDATE summaries SET fingerprint = ? WHERE patient_name = ?", (fingerprint, patient_name))
+
+    def delete_summary(self, patient_name: str):
+        with self._write() as conn:
+            conn.execute(
+                "UPDATE summaries SET deleted = 1, rev = ?, updated_at = ? WHERE patient_name = ? AND deleted = 0",
+                (self._next_rev(conn), time.time(), patient_name),
+            )
+
+    def get_summary(self, patient_name: str) -> Optional[Dict]:
+        row = self.conn.execute(
+            "SELECT data FROM summaries WHERE patient_name = ? AND deleted = 0", (patient_name,)
+        ).fetchone()
+        return json.loads(row['data']) if row else None
+
+    def load_summaries(self) -> Dict[str, Dict]:
+        rows = self.conn.execute("SELECT patient_name, data FROM summaries WHERE deleted = 0")
+        return {row['patient_name']: json.loads(row['data']) for row in rows}
+
+    # ------------------ Documents ------------------
+    def upsert_document(
+        self,
+        patient_name: str,
+        path: str,
+        filename: str,
+        category: str,
+        sha256: Optional[str] = None,
+        size: Optional[int] = None,
+        mtime_ns: Optional[int] = None,
+    ):
+        with self._write() as conn:
+            self._upsert_document(conn, self._next_rev(conn), patient_name, path, filename, category, sha256, size, mtime_ns)
+
+    @staticmethod
+    def _upsert_document(conn, rev, patient_name, path, filename, category, sha256=None, size=None, mtime_ns=None):
+        conn.execute(
+            """INSERT INTO documents (path, patient_name, filename, category, sha256, size, mtime_ns, rev, updated_at, deleted)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)
+               ON CONFLICT(path) DO UPDATE SET
+                   patient_name = excluded.patient_name, filename = excluded.filename,
+                   category = excluded.category, sha256 = excluded.sha256, size = excluded.size,
+                   mtime_ns = excluded.mtime_ns, rev = excluded.rev, updated_at = excluded.updated_at, deleted = 0""",
+            (path, patient_name, filename, category, sha256, size, mtime_ns, rev, time.time()),
+        )
+
+    def delete_documents(self, paths: List[str]):
+        if not paths:
+            return
+        with self._write() as conn:
+            rev = self._next_rev(conn)
+            conn.executemany(
+                "UPDATE documents SET deleted = 1, rev = ?, updated_at = ? WHERE path = ? AND deleted = 0",
+                [(rev, time.time(), path) for path in paths],
+            )
+
+    @staticmethod
+    def _document_entry(row) -> Dict:
+        return {"filename": row['filename'], "category": row['category'], "path": row['path']}
+
+    def patient_documents(self, patient_name: str) -> List[Dict]:
+        rows = self.conn.execute(
+            "SELECT filename, category, path FROM documents WHERE patient_name = ? AND deleted = 0 ORDER BY rowid",
+            (patient_name,),
+        )
+        return [self._document_entry(row) for row in rows]
+
+    def load_manifest(self) -> Dict[str, List[Dict]]:
+        """All live documents grouped by patient, in the document_manifest.json shape."""
+        manifest: Dict[str, List[Dict]] = {}
+        rows = self.conn.execute(
+            "SELECT patient_name, filename, category, path FROM documents WHERE deleted = 0 ORDER BY rowid"
+        )
+        for row in rows:
+            manifest.setdefault(row['patient_name'], []).append(self._document_entry(row))
+        return manifest
+
+    def document_fingerprints(self, patient_name: str) -> Dict[str, Optional[str]]:
+        """Path -> content hash of the patient's classified documents."""
+        rows = self.conn.execute(
+            "SELECT path, sha256 FROM documents WHERE patient_name = ? AND deleted = 0", (patient_name,)
+        )
+        return {row['path']: row['sha256'] for row in rows}
+
+    def set_fingerprints(self, fingerprints: List[Tuple[str, str, int, int]]):
+        """Records (path, sha256, size, mtime_ns) for existing rows; readers see no change, so the revision stays."""
+        if not fingerprints:
+            return
+        with self._write() as conn:
+            conn.executemany(
+                "UPDATE documents SET sha256 = ?, size = ?, mtime_ns = ? WHERE path = ?",
+                [(sha256, size, mtime_ns, path) for path, sha256, size, mtime_ns in fingerprints],
+            )
+
+    # ------------------ Change feed ------------------
+    def changes_since(self, rev: int) -> Tuple[int, Dict[str, Optional[Dict]], Dict[str, List[Dict]]]:
+        """
+        Returns (current revision, changed summaries, changed patients'
+        documents). Deleted summaries map to None; the document lists are the
+        complete current lists of every patient with a changed document.
+        """
+        conn = self.conn
+        conn.execute("BEGIN")
+        try:
+            current = self.current_rev()
+            summaries = {
+                row['patient_name']: None if row['deleted'] else json.loads(row['data'])
+                for row in conn.execute("SELECT patient_name, data, deleted FROM summaries WHERE rev > ?", (rev,))
+            }
+            patients = [
+                row[0] for row in conn.execute("SELECT DISTINCT patient_name FROM documents WHERE rev > ?", (rev,))
+            ]
+            documents = {patient: self.patient_documents(patient) for patient in patients}
+        finally:
+            conn.execute("COMMIT")
+        return current, summaries, documents
+
+    # ------------------ JSON import ------------------
+    def import_json(self, summary_file: str = SUMMARY_CACHE_FILE, manifest_file: str = DOCUMENT_MANIFEST_FILE) -> Tuple[int, int]:
+        """Upserts the legacy JSON summary cache and document manifest in one transaction."""
+        summaries = {}
+        manifest = {}
+        if os.path.exists(summary_file):
+            with open(summary_file, 'r') as f:
+                summaries = json.load(f)
+        if os.path.exists(manifest_file):
+            with open(manifest_file, 'r') as f:
+                manifest = json.load(f)
+        documents = 0
+        with self._write() as conn:
+            rev = self._next_rev(conn)
+            for patient_name, summary in summaries.items():
+                self._upsert_summary(conn, rev, patient_name, summary)
+            for patient_name, docs in manifest.items():
+                for doc in docs:
+                    self._upsert_document(conn, rev, patient_name, doc['path'], doc['filename'], doc.get('category', 'Other'))
+                    documents += 1
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_imported', ?)", (str(time.time()),))
+        return len(summaries), documents
+
+    def import_json_once(self) -> bool:
+        """Imports the JSON files into a store that has never seen them; returns whether it did."""
+        if self.get_meta('json_imported') is not None:
+            return False
+        if not (os.path.exists(SUMMARY_CACHE_FILE) or os.path.exists(DOCUMENT_MANIFEST_FILE)):
+            return False
+        summaries, documents = self.import_json()
+        print(f"📥 Imported {summaries} summaries and {documents} documents into {self.path}")
+        return True
+
+_default_store: Optional[PatientStore] = None
+_default_store_lock = threading.Lock()
+
+def get_patient_store() -> PatientStore:
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = PatientStore()
+            _default_store.import_json_once()
+        return _default_store
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the patient SQLite store.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    importer = sub.add_parser("import", help="Import patient_summary_cache.json and document_manifest.json")
+    importer.add_argument("--summaries", default=SUMMARY_CACHE_FILE)
+    importer.add_argument("--manifest", default=DOCUMENT_MANIFEST_FILE)
+    importer.add_argument("--db", default=PATIENT_STORE_PATH)
+    args = parser.parse_args(argv)
+
+    if args.command == "import":
+        store = PatientStore(args.db)
+        summaries, documents = store.import_json(args.summaries, args.manifest)
+        print(f"✅ Imported {summaries} summaries and {documents} documents into {args.db} (rev {store.current_rev()})")
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,35 @@
 import os
+import hashlib
+from collections import OrderedDict
+from typing import Dict, Generator, List, Sequence, Tuple, Union
 from dotenv import load_dotenv
 from langchain.chains import create_tagging_chain_pydantic
 from langchain_openai import ChatOpenAI
+from langchain_core.output_parsers import StrOutputParser
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 from schema import DocumentSummary, DocumentClassification # Assuming schema.py is in the parent directory
 
 load_dotenv()
 
+MODEL_NAME = "gpt-3.5-turbo-0125"
+# LLM requests in flight at once for the *_many methods.
+PROCESSOR_MAX_CONCURRENCY = int(os.getenv("PROCESSOR_MAX_CONCURRENCY", "8"))
+# Documents longer than one chunk (in tokens) are summarized map-reduce: each chunk first, then the partial summaries.
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "3000"))
+SUMMARY_CHUNK_OVERLAP = int(os.getenv("SUMMARY_CHUNK_OVERLAP", "200"))
+# Summaries and classifications kept per processor, by content hash.
+PROCESSOR_CACHE_MAX_ENTRIES = int(os.getenv("PROCESSOR_CACHE_MAX_ENTRIES", "2048"))
+# Map rounds before whatever is left is cut to one chunk (each round shrinks the text roughly tenfold).
+MAP_REDUCE_MAX_ROUNDS = 3
+
 class DocumentProcessor:
-    def __init__(self):
-        self.llm = ChatOpenAI(temperature=0, model="gpt-3.5-turbo-0125", api_key=os.getenv("OPENAI_API_KEY"))
+    def __init__(self, max_concurrency: int = PROCESSOR_MAX_CONCURRENCY, cache_max_entries: int = PROCESSOR_CACHE_MAX_ENTRIES):
+        self.llm = ChatOpenAI(temperature=0, model=MODEL_NAME, api_key=os.getenv("OPENAI_API_KEY"))
+        self.batch_config = {"max_concurrency": max_concurrency}
+        self.splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+            model_name=MODEL_NAME, chunk_size=SUMMARY_CHUNK_TOKENS, chunk_overlap=SUMMARY_CHUNK_OVERLAP,
+        )
 
         # Prompt for summarization
         self.summary_prompt = ChatPromptTemplate.from_messages([
@@ -20,29 +40,174 @@ class DocumentProcessor:
         # Chain for summarization
         self.summary_chain = self.summary_prompt | self.llm.with_structured_output(DocumentSummary)
 
+        # Map step for long documents: plain-text notes per chunk, which summary_chain then reduces
+        self.map_prompt = ChatPromptTemplate.from_messages([
+            ("system", "You are an expert medical document summarizer. You are given one part of a longer document."),
+            ("human", "Summarize this part, keeping every diagnosis, medication with dosage, test result and date:\n\n{document_content}")
+        ])
+        self.map_chain = self.map_prompt | self.llm | StrOutputParser()
+
         # Chain for classification using Pydantic tagging
         self.classification_chain = create_tagging_chain_pydantic(DocumentClassification, self.llm)
 
+        # Results by task and content hash, so a document is never sent twice (least recently used dropped first)
+        self._cache: "OrderedDict[str, Union[DocumentSummary, DocumentClassification]]" = OrderedDict()
+        self.cache_max_entries = cache_max_entries
 
-    def summarize_document(self, text_content: str) -> DocumentSummary:
-        """Summarizes the given document content."""
+    # ------------------ Cache ------------------
+    def _lookup(self, task: str, texts: Sequence[str]) -> Tuple[List[str], Dict, Dict[str, str]]:
+        """Content keys for `texts`, the results already cached by key, and the texts still to process by key."""
+        keys = [hashlib.sha256(f"{task}\0{MODEL_NAME}\0{text}".encode("utf-8")).hexdigest() for text in texts]
+        results, pending = {}, {}
+        for key, text in zip(keys, texts):
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                results[key] = self._cache[key]
+            else:
+                pending.setdefault(key, text)
+        return keys, results, pending
+
+    def _remember(self, results: Dict, outcomes: Dict, task: str, validate=None):
+        """Adds successful outcomes to `results` and the cache; failures are logged and not cached."""
+        for key, outcome in outcomes.items():
+            try:
+                if isinstance(outcome, Exception):
+                    raise outcome
+                value = validate(outcome) if validate else outcome
+            except Exception as e:
+                print(f"Error during {task}: {e}")
+                continue
+            results[key] = value
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_max_entries:
+                self._cache.popitem(last=False)
+
+    # ------------------ Map step ------------------
+    def _settle(self, pending: Dict[str, List[str]], condensed: Dict, final: bool = False):
+        """Moves documents that fit one prompt (all of them when `final`) from `pending` to `condensed`."""
+        for key in [key for key, chunks in pending.items() if final or len(chunks) <= 1]:
+            chunks = pending.pop(key)
+            if len(chunks) > 1:
+                print(f"Document still too long after {MAP_REDUCE_MAX_ROUNDS} map rounds; summarizing its first part only.")
+            condensed[key] = chunks[0] if chunks else ""
+
+    def _regroup(self, flat: List[Tuple[str, str]], notes: List, condensed: Dict) -> Dict[str, List[str]]:
+        """Splits each document's joined chunk notes again; a failed chunk fails its document."""
+        grouped: Dict[str, List] = {}
+        for (key, _), note in zip(flat, notes):
+            grouped.setdefault(key, []).append(note)
+        pending = {}
+        for key, doc_notes in grouped.items():
+            error = next((note for note in doc_notes if isinstance(note, Exception)), None)
+            if error is not None:
+                condensed[key] = error
+            else:
+                pending[key] = self.splitter.split_text("\n\n".join(doc_notes))
+        return pending
+
+    def _map_rounds(self, texts: Dict[str, str]) -> Generator[List[Dict[str, str]], List, Dict[str, Union[str, Exception]]]:
+        """
+        Map step. Every document longer than one chunk is split, and the chunks
+        of all of them are summarized in one bounded batch, repeating on the
+        partial summaries until each document fits one prompt. Yields each
+        round's map_chain inputs, is sent back their outcomes, and returns the
+        text to reduce per key, or the exception that stopped that document.
+        """
+        condensed: Dict[str, Union[str, Exception]] = {}
+        pending = {key: self.splitter.split_text(text) for key, text in texts.items()}
+        for _ in range(MAP_REDUCE_MAX_ROUNDS):
+            self._settle(pending, condensed)
+            if not pending:
+                break
+            flat = [(key, chunk) for key, chunks in pending.items() for chunk in chunks]
+            notes = yield [{"document_content": chunk} for _, chunk in flat]
+            pending = self._regroup(flat, notes, condensed)
+        self._settle(pending, condensed, final=True)
+        return condensed
+
+    async def _condense(self, texts: Dict[str, str]) -> Dict[str, Union[str, Exception]]:
+        """_map_rounds with each round batched through the async chain API."""
+        rounds = self._map_rounds(texts)
         try:
-            summary = self.summary_chain.invoke({"document_content": text_content})
-            return summary
-        except Exception as e:
-            print(f"Error during summarization: {e}")
-            return DocumentSummary(summary_text="Failed to summarize document.", key_findings=[])
+            inputs = next(rounds)
+            while True:
+                inputs = rounds.send(await self.map_chain.abatch(inputs, config=self.batch_config, return_exceptions=True))
+        except StopIteration as done:
+            return done.value
 
-    def classify_document(self, text_content: str) -> DocumentClassification:
-        """Classifies the given document content."""
+    def _condense_sync(self, texts: Dict[str, str]) -> Dict[str, Union[str, Exception]]:
+        """_map_rounds on the synchronous chain API, for callers with or without a running event loop."""
+        rounds = self._map_rounds(texts)
         try:
-            classification = self.classification_chain.invoke({"input": text_content})
+            inputs = next(rounds)
+            while True:
+                inputs = rounds.send(self.map_chain.batch(inputs, config=self.batch_config, return_exceptions=True))
+        except StopIteration as done:
+            return done.value
+
+    def _classification_inputs(self, texts: Dict[str, str]) -> List[Dict[str, str]]:
+        # Tokens rarely exceed 8 characters, so this is enough for the first chunk without splitting the whole document.
+        return [{"input": (self.splitter.split_text(text[:SUMMARY_CHUNK_TOKENS * 8]) or [""])[0]} for text in texts.values()]
+
+    # ------------------ Public API ------------------
+    async def summarize_many(self, texts: Sequence[str]) -> List[DocumentSummary]:
+        """
+        Summarizes many documents in one parallel pass, at most max_concurrency
+        requests at a time. Long documents are summarized map-reduce over
+        chunks; cached and repeated contents are not sent again.
+        """
+        keys, results, pending = self._lookup("summary", texts)
+        if pending:
+            condensed = await self._condense(pending)
+            ready = {key: text for key, text in condensed.items() if not isinstance(text, Exception)}
+            summaries = await self.summary_chain.abatch(
+                [{"document_content": text} for text in ready.values()], config=self.batch_config, return_exceptions=True,
+            )
+            condensed.update(zip(ready, summaries))
+            self._remember(results, condensed, "summarization")
+        return [results.get(key) or DocumentSummary(summary_text="Failed to summarize document.", key_findings=[]) for key in keys]
+
+    async def classify_many(self, texts: Sequence[str]) -> List[DocumentClassification]:
+        """
+        Classifies many documents in one parallel pass, at most max_concurrency
+        requests at a time. A document's type is evident from its start, so
+        only the first chunk of long documents is sent.
+        """
+        keys, results, pending = self._lookup("classification", texts)
+        if pending:
+            outcomes = await self.classification_chain.abatch(
+                self._classification_inputs(pending), config=self.batch_config, return_exceptions=True,
+            )
             # create_tagging_chain_pydantic returns a dict, so we validate it
-            return DocumentClassification.model_validate(classification)
-        except Exception as e:
-            print(f"Error during classification: {e}")
-            return DocumentClassification(category="Unknown", is_sensitive=True)
+            self._remember(results, dict(zip(pending, outcomes)), "classification", DocumentClassification.model_validate)
+        return [results.get(key) or DocumentClassification(category="Unknown", is_sensitive=True) for key in keys]
 
+    def summarize_document(self, text_content: str) -> DocumentSummary:
+        """Summarizes the given document content (map-reduce when it is long)."""
+        keys, results, pending = self._lookup("summary", [text_content])
+        if pending:
+            condensed = self._condense_sync(pending)
+            for key, text in list(condensed.items()):
+                if not isinstance(text, Exception):
+                    try:
+                        condensed[key] = self.summary_chain.invoke({"document_content": text})
+                    except Exception as e:
+                        condensed[key] = e
+            self._remember(results, condensed, "summarization")
+        return results.get(keys[0]) or DocumentSummary(summary_text="Failed to summarize document.", key_findings=[])
+
+    def classify_document(self, text_content: str) -> DocumentClassification:
+        """Classifies the given document content."""
+        keys, results, pending = self._lookup("classification", [text_content])
+        if pending:
+            try:
+                outcome = self.classification_chain.invoke(self._classification_inputs(pending)[0])
+            except Exception as e:
+                outcome = e
+            # create_tagging_chain_pydantic returns a dict, so we validate it
+            self._remember(results, {keys[0]: outcome}, "classification", DocumentClassification.model_validate)
+        return results.get(keys[0]) or DocumentClassification(category="Unknown", is_sensitive=True)
 
 if __name__ == "__main__":
     processor = DocumentProcessor()
@@ -0,0 +1,140 @@
+import os
+import time
+import asyncio
+import threading
+import traceback
+from typing import Awaitable, Callable, Dict, List, Optional
+
+# A patient is processed once its folder has been quiet this long...
+REGEN_QUIET_SECONDS = float(os.getenv("REGEN_QUIET_SECONDS", "2"))
+# ...or this long after its first unprocessed event, whichever comes first.
+REGEN_MAX_DELAY_SECONDS = float(os.getenv("REGEN_MAX_DELAY_SECONDS", "30"))
+
+class RegenerationQueue:
+    """
+    Coalesces file system events into one job per patient. `mark_dirty` only
+    records the time of the event; a worker thread runs `process(key)` once no
+    event for that key has arrived for `quiet_seconds`, or `max_delay` after
+    the first pending one so a steady trickle of writes cannot starve it.
+    Jobs run one at a time on a long-lived event loop, and a key marked dirty
+    while its job runs is queued again rather than lost.
+    """
+
+    def __init__(
+        self,
+        process: Callable[[str], Awaitable],
+        quiet_seconds: float = REGEN_QUIET_SECONDS,
+        max_delay: float = REGEN_MAX_DELAY_SECONDS,
+        on_close: Optional[Callable[[], Awaitable]] = None,
+    ):
+        self.process = process
+        self.quiet_seconds = quiet_seconds
+        self.max_delay = max(max_delay, quiet_seconds)
+        self.on_close = on_close
+        # key -> [first pending event, latest event] (monotonic seconds)
+        self._pending: Dict[str, List[float]] = {}
+        self._running: Optional[str] = None
+        self._stopped = False
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self.events = 0
+        self.processed = 0
+        self.failures = 0
+        self.total_duration = 0.0
+        self.last_run: Optional[Dict] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="regeneration", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def mark_dirty(self, key: str):
+        """Thread-safe; called from the watchdog thread."""
+        now = time.monotonic()
+        with self._cond:
+            self.events += 1
+            times = self._pending.get(key)
+            if times is None:
+                self._pending[key] = [now, now]
+            else:
+                times[1] = now
+            self._cond.notify()
+
+    def _next_due(self):
+        """Returns (key, None) for a key that is due, else (None, seconds until the next one)."""
+        now = time.monotonic()
+        wait = None
+        for key, (first, last) in self._pending.items():
+            due = min(last + self.quiet_seconds, first + self.max_delay)
+            if due <= now:
+                return key, None
+            wait = due - now if wait is None else min(wait, due - now)
+        return None, wait
+
+    def _take(self) -> Optional[str]:
+        with self._cond:
+            while not self._stopped:
+                key, wait = self._next_due()
+                if key is not None:
+                    del self._pending[key]
+                    self._running = key
+                    return key
+                self._cond.wait(wait)
+            return None
+
+    def _run(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            while True:
+                key = self._take()
+                if key is None:
+                    return
+                started = time.monotonic()
+                ok = True
+                try:
+                    loop.run_until_complete(self.process(key))
+                except Exception as e:
+                    ok = False
+                    print(f"❌ Regeneration failed for {key.strip()}: {e}")
+                    traceback.print_exc()
+                duration = time.monotonic() - started
+                with self._cond:
+                    self._running = None
+                    self.processed += 1
+                    self.failures += 0 if ok else 1
+                    self.total_duration += duration
+                    self.last_run = {
+                        "patient": key.strip(),
+                        "ok": ok,
+                        "duration_s": round(duration, 3),
+                        "finished_at": time.time(),
+                    }
+        finally:
+            if self.on_close is not None:
+                loop.run_until_complete(self.on_close())
+            loop.close()
+
+    def stats(self) -> Dict:
+        with self._cond:
+            pending = sorted(key.strip() for key in self._pending)
+            running = self._running.strip() if self._running is not None else None
+            return {
+                "depth": len(pending) + (running is not None),
+                "pending": pending,
+                "running": running,
+                "events": self.events,
+                "processed": self.processed,
+                "failures": self.failures,
+                "avg_duration_s": round(self.total_duration / self.processed, 3) if self.processed else None,
+                "last_run": self.last_run,
+                "quiet_seconds": self.quiet_seconds,
+                "max_delay_seconds": self.max_delay,
+            }
@@ -0,0 +1,76 @@
+import os
+import hashlib
+from typing import Dict, List, Tuple, Union
+from llama_index.core import Settings
+from llama_index.core.indices.vector_store.base import VectorStoreIndex
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from metrics import timed
+
+# Nodes fetched per query before packing.
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "8"))
+# Upper bound on the context handed to the LLM, in estimated tokens.
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return max(1, len(text) // 4)
+
+@timed("retrieval")
+def retrieve_nodes(index: VectorStoreIndex, query: Union[str, QueryBundle], top_k: int = RETRIEVAL_TOP_K) -> List[NodeWithScore]:
+    return index.as_retriever(similarity_top_k=top_k).retrieve(query)
+
+@timed("retrieval")
+def retrieve_union(index: VectorStoreIndex, queries: List[str], top_k: int = RETRIEVAL_TOP_K) -> List[NodeWithScore]:
+    """
+    Runs one similarity search per query against the same retriever and
+    merges the results, keeping each node once with its best score. Saves
+    the per-query synthesis calls, not the searches themselves.
+    """
+    embeddings = [Settings.embed_model.get_query_embedding(query) for query in queries]
+    retriever = index.as_retriever(similarity_top_k=top_k)
+    best: Dict[str, NodeWithScore] = {}
+    for query, embedding in zip(queries, embeddings):
+        for node in retriever.retrieve(QueryBundle(query_str=query, embedding=embedding)):
+            current = best.get(node.node.node_id)
+            if current is None or (node.score or 0.0) > (current.score or 0.0):
+                best[node.node.node_id] = node
+    return list(best.values())
+
+def _text_key(text: str) -> str:
+    return hashlib.sha256(" ".join(text.split()).lower().encode('utf-8')).hexdigest()
+
+def pack_context(nodes: List[NodeWithScore], token_budget: int = CONTEXT_TOKEN_BUDGET) -> Tuple[str, List[NodeWithScore], int]:
+    """
+    Packs retrieved nodes into a context string in relevance order. Nodes
+    with the same id or the same (whitespace/case-normalised) text are kept
+    once, and a node that would overflow `token_budget` is skipped in favour
+    of later, smaller ones. Returns the context, the packed nodes and the
+    estimated token count.
+    """
+    seen_ids = set()
+    seen_texts = set()
+    packed = []
+    sections = []
+    used = 0
+    for node in sorted(nodes, key=lambda n: n.score or 0.0, reverse=True):
+        text = node.node.get_content().strip()
+        key = _text_key(text)
+        if not text or node.node.node_id in seen_ids or key in seen_texts:
+            continue
+        source = os.path.basename(node.node.ref_doc_id or "unknown")
+        section = f"[Source: {source}]\n{text}"
+        cost = estimate_tokens(section)
+        if used + cost > token_budget:
+            continue
+        seen_ids.add(node.node.node_id)
+        seen_texts.add(key)
+        packed.append(node)
+        sections.append(section)
+        used += cost
+    return "\n\n".join(sections), packed, used
+
+def describe_sources(nodes: List[NodeWithScore]) -> List[Dict]:
+    return [
+        {"node_id": node.node.node_id, "document": node.node.ref_doc_id, "score": node.score}
+        for node in nodes
+    ]
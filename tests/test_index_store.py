@@ -0,0 +1,83 @@
+import os
+import pytest
+from llama_index.core import Settings
+from llama_index.core.embeddings import MockEmbedding
+from index_store import (
+    INDEX_UNCHANGED, build_patient_index, has_stored_documents, load_or_build_index, load_patient_documents,
+    update_document_in_index,
+)
+
+MODEL = "mock"
+# Long enough to count as boilerplate once it repeats in three documents.
+DISCLAIMER = "This document contains confidential health information protected by federal law."
+
+NOTES = {
+    "a.txt": "Cardiology follow-up. Blood pressure 142/90, metoprolol increased to 50 mg twice daily. Echo shows preserved ejection fraction.",
+    "b.txt": "Endocrinology visit. HbA1c 7.9 percent, metformin continued and glipizide 5 mg added. Retinal screening is due in March.",
+    "c.txt": "Orthopedic consult for right knee pain. X-ray shows moderate osteoarthritis; physical therapy twice weekly for six weeks.",
+    "d.txt": "Pulmonology review. Spirometry FEV1 68 percent predicted, tiotropium started, pulmonary rehab referral placed today.",
+}
+
+@pytest.fixture(autouse=True)
+def mock_embeddings(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    Settings.embed_model = MockEmbedding(embed_dim=8)
+
+@pytest.fixture
+def patient(tmp_path):
+    folder = tmp_path / "data" / "alice"
+    folder.mkdir(parents=True)
+    return str(folder), str(tmp_path / "index_storage")
+
+def write_note(folder, name, disclaimer=True):
+    with open(os.path.join(folder, name), "w", encoding="utf-8") as f:
+        f.write(f"{NOTES[name]}\n{DISCLAIMER}\n" if disclaimer else f"{NOTES[name]}\n")
+
+def contents(index):
+    """Node texts and stored document hash per source document."""
+    return {
+        ref_doc_id: (sorted(index.docstore.get_node(node_id).get_content() for node_id in info.node_ids),
+                     index.docstore.get_document_hash(ref_doc_id))
+        for ref_doc_id, info in index.ref_doc_info.items()
+    }
+
+def update(folder, storage_root):
+    return update_document_in_index("alice", folder, folder, build_patient_index, load_patient_documents, MODEL, storage_root)
+
+def test_incremental_add_and_delete_match_a_full_build(patient):
+    folder, storage_root = patient
+    for name in ("a.txt", "b.txt", "d.txt"):
+        write_note(folder, name, disclaimer=name != "d.txt")
+    load_or_build_index("alice", folder, build_patient_index, MODEL, storage_root)
+
+    # The third copy of the disclaimer turns it into boilerplate, so b.txt's prepared text changes too.
+    write_note(folder, "c.txt")
+    added = update(folder, storage_root)
+    assert contents(added) == contents(build_patient_index(folder))
+    b_nodes, _ = contents(added)[os.path.join(folder, "b.txt")]
+    assert DISCLAIMER not in "".join(b_nodes)
+
+    os.remove(os.path.join(folder, "c.txt"))
+    deleted = update(folder, storage_root)
+    assert contents(deleted) == contents(build_patient_index(folder))
+
+    reloaded = load_or_build_index("alice", folder, build_patient_index, MODEL, storage_root)
+    assert contents(reloaded) == contents(deleted)
+
+def test_unchanged_content_is_reported_as_unchanged(patient):
+    folder, storage_root = patient
+    write_note(folder, "a.txt")
+    load_or_build_index("alice", folder, build_patient_index, MODEL, storage_root)
+
+    os.utime(os.path.join(folder, "a.txt"))
+    assert update(folder, storage_root) is INDEX_UNCHANGED
+    assert has_stored_documents("alice", storage_root)
+
+def test_removing_every_document_leaves_an_empty_store(patient):
+    folder, storage_root = patient
+    write_note(folder, "a.txt")
+    load_or_build_index("alice", folder, build_patient_index, MODEL, storage_root)
+
+    os.remove(os.path.join(folder, "a.txt"))
+    assert update(folder, storage_root) is None
+    assert not has_stored_documents("alice", storage_root)
@@ -0,0 +1,118 @@
+import threading
+from types import SimpleNamespace
+import pytest
+from patient_index_cache import PatientIndexCache
+
+def fake_index(nbytes: int = 100):
+    """Stands in for a VectorStoreIndex as far as estimate_index_bytes is concerned."""
+    return SimpleNamespace(vector_store=SimpleNamespace(nbytes=nbytes), docstore=SimpleNamespace(docs={}))
+
+class BlockingLoader:
+    """Loader whose calls wait until release(), so a test can act while a first load is in flight."""
+
+    def __init__(self, result=None):
+        self.result = result if result is not None else fake_index()
+        self.started = threading.Event()
+        self._release = threading.Event()
+        self.calls = 0
+
+    def __call__(self, patient_name):
+        self.calls += 1
+        self.started.set()
+        assert self._release.wait(5)
+        return self.result
+
+    def release(self):
+        self._release.set()
+
+def get_in_thread(cache, patient_name):
+    out = {}
+    thread = threading.Thread(target=lambda: out.setdefault("index", cache.get(patient_name)))
+    thread.start()
+    return thread, out
+
+def test_concurrent_misses_share_one_load():
+    loader = BlockingLoader()
+    cache = PatientIndexCache(loader)
+    first, first_out = get_in_thread(cache, "alice")
+    assert loader.started.wait(5)
+    second, second_out = get_in_thread(cache, "alice")
+    loader.release()
+    first.join(5)
+    second.join(5)
+    assert loader.calls == 1
+    assert first_out["index"] is second_out["index"] is loader.result
+    assert cache.peek("alice") is loader.result
+
+def test_discard_during_first_load_drops_the_loaded_index():
+    loader = BlockingLoader()
+    cache = PatientIndexCache(loader)
+    thread, out = get_in_thread(cache, "alice")
+    assert loader.started.wait(5)
+    cache.discard("alice")
+    loader.release()
+    thread.join(5)
+    assert out["index"] is None
+    assert "alice" not in cache
+
+def test_replace_if_resident_during_first_load_wins_over_the_loaded_index():
+    loader = BlockingLoader()
+    cache = PatientIndexCache(loader)
+    thread, out = get_in_thread(cache, "alice")
+    assert loader.started.wait(5)
+    newer = fake_index()
+    cache.replace_if_resident("alice", newer)
+    loader.release()
+    thread.join(5)
+    assert out["index"] is newer
+    assert cache.peek("alice") is newer
+
+def test_replace_if_resident_leaves_cold_patients_unloaded():
+    cache = PatientIndexCache(lambda name: fake_index())
+    cache.replace_if_resident("alice", fake_index())
+    assert "alice" not in cache
+
+def test_failed_load_reaches_every_waiter_and_is_retried():
+    attempts = []
+
+    def loader(patient_name):
+        attempts.append(patient_name)
+        if len(attempts) == 1:
+            raise OSError("store unreadable")
+        return fake_index()
+
+    cache = PatientIndexCache(loader)
+    with pytest.raises(OSError):
+        cache.get("alice")
+    assert cache.get("alice") is not None
+    assert len(attempts) == 2
+
+def test_evicts_least_recently_used_over_the_byte_budget():
+    cache = PatientIndexCache(lambda name: fake_index(100), max_entries=10, max_bytes=250)
+    cache.get("alice")
+    cache.get("bob")
+    cache.get("alice")
+    cache.get("carol")
+    assert cache.resident() == ["alice", "carol"]
+    assert cache.bytes == 200
+    assert cache.evictions == 1
+
+def test_evicts_over_the_entry_limit():
+    cache = PatientIndexCache(lambda name: fake_index(1), max_entries=2)
+    for name in ("alice", "bob", "carol"):
+        cache.get(name)
+    assert cache.resident() == ["bob", "carol"]
+
+def test_keeps_a_single_index_larger_than_the_budget():
+    cache = PatientIndexCache(lambda name: fake_index(1000), max_bytes=100)
+    assert cache.get("alice") is not None
+    assert cache.resident() == ["alice"]
+    cache.get("bob")
+    assert cache.resident() == ["bob"]
+
+def test_discard_releases_its_bytes():
+    cache = PatientIndexCache(lambda name: fake_index(100))
+    cache.get("alice")
+    cache.discard("alice")
+    assert cache.bytes == 0
+    assert len(cache) == 0
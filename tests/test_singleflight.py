@@ -0,0 +1,71 @@
+import asyncio
+import pytest
+from singleflight import SingleFlight
+
+def test_concurrent_calls_with_one_key_run_once():
+    async def scenario():
+        flight = SingleFlight()
+        runs = []
+
+        async def work():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            return "answer"
+
+        results = await asyncio.gather(*(flight.do("q", work) for _ in range(3)))
+        return flight, runs, results
+
+    flight, runs, results = asyncio.run(scenario())
+    assert results == ["answer"] * 3
+    assert len(runs) == 1
+    assert flight.stats() == {"calls": 3, "executed": 1, "coalesced": 2, "in_flight": 0}
+
+def test_different_keys_do_not_coalesce():
+    async def scenario():
+        flight = SingleFlight()
+
+        async def work(value):
+            await asyncio.sleep(0.01)
+            return value
+
+        return await asyncio.gather(flight.do("a", lambda: work("a")), flight.do("b", lambda: work("b")))
+
+    assert asyncio.run(scenario()) == ["a", "b"]
+
+def test_exception_reaches_every_caller_and_next_call_runs_again():
+    async def scenario():
+        flight = SingleFlight()
+        runs = []
+
+        async def failing():
+            runs.append(1)
+            await asyncio.sleep(0.01)
+            raise ValueError("upstream failed")
+
+        results = await asyncio.gather(flight.do("q", failing), flight.do("q", failing), return_exceptions=True)
+        with pytest.raises(ValueError):
+            await flight.do("q", failing)
+        return results, runs
+
+    results, runs = asyncio.run(scenario())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert len(runs) == 2
+
+def test_cancelled_caller_does_not_cancel_the_shared_call():
+    async def scenario():
+        flight = SingleFlight()
+        release = asyncio.Event()
+
+        async def work():
+            await release.wait()
+            return "answer"
+
+        leaving = asyncio.ensure_future(flight.do("q", work))
+        staying = asyncio.ensure_future(flight.do("q", work))
+        await asyncio.sleep(0)
+        leaving.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        return leaving.cancelled(), await staying
+
+    assert asyncio.run(scenario()) == (True, "answer")
@@ -0,0 +1,124 @@
+import os
+import gzip
+import json
+import hashlib
+import threading
+from typing import Dict, List, Optional, Tuple
+from metrics import record_cache
+
+TEXT_CACHE_DIR = os.getenv("TEXT_CACHE_DIR", ".text_cache")
+# Total on-disk budget for cached text; 0 disables the cache.
+TEXT_CACHE_MAX_BYTES = int(os.getenv("TEXT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+_digest_memo: Dict[str, Tuple[int, int, str]] = {}
+_digest_lock = threading.Lock()
+
+def file_digest(file_path, chunk_size=1 << 20) -> str:
+    """SHA-256 of the file's bytes, memoized per process on (size, mtime)."""
+    stat = os.stat(file_path)
+    with _digest_lock:
+        memo = _digest_memo.get(file_path)
+    if memo and memo[0] == stat.st_size and memo[1] == stat.st_mtime_ns:
+        return memo[2]
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            digest.update(block)
+    with _digest_lock:
+        _digest_memo[file_path] = (stat.st_size, stat.st_mtime_ns, digest.hexdigest())
+    return digest.hexdigest()
+
+class TextCache:
+    """
+    On-disk cache of extracted page texts keyed by file content hash. Entries
+    are gzipped JSON written atomically, so the API and the summary generator
+    can share one directory. A hit refreshes the entry's mtime, and eviction
+    removes the least recently used entries once `max_bytes` is exceeded.
+    """
+
+    def __init__(self, cache_dir: str = TEXT_CACHE_DIR, max_bytes: int = TEXT_CACHE_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._size_estimate: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.json.gz")
+
+    def get(self, digest: str) -> Optional[List[str]]:
+        if not self.enabled:
+            return None
+        path = self._path(digest)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                pages = json.load(f)
+            os.utime(path)
+        except (FileNotFoundError, OSError, ValueError):
+            self.misses += 1
+            record_cache("text", misses=1)
+            return None
+        self.hits += 1
+        record_cache("text", hits=1)
+        return pages
+
+    def put(self, digest: str, pages: List[str]):
+        if not self.enabled:
+            return
+        path = self._path(digest)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as f:
+            json.dump(pages, f)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._size_estimate is None:
+                self._size_estimate = self._scan_size()
+            else:
+                self._size_estimate += os.path.getsize(path)
+            over_budget = self._size_estimate > self.max_bytes
+        if over_budget:
+            self.evict()
+
+    def _entries(self):
+        for subdir, _, files in os.walk(self.cache_dir):
+            for file in files:
+                if file.endswith('.json.gz'):
+                    path = os.path.join(subdir, file)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    yield path, stat.st_size, stat.st_mtime
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Drops least recently used entries until the cache is back under 90% of its budget."""
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda entry: entry[2])
+            total = sum(size for _, size, _ in entries)
+            target = int(self.max_bytes * 0.9)
+            for path, size, _ in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+            self._size_estimate = total
+
+_default_cache: Optional[TextCache] = None
+
+def get_text_cache() -> TextCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = TextCache()
+    return _default_cache
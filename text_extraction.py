@@ -0,0 +1,148 @@
+import os
+import atexit
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Iterable, List, Optional, Tuple
+import fitz  # PyMuPDF
+from text_cache import file_digest, get_text_cache
+from metrics import stage_timer, timed
+
+# Worker processes used for PDF parsing; 1 keeps everything in-process.
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+# Large PDFs are split into page ranges of this size and parsed in parallel.
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "32"))
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+# ------------------ Readers ------------------
+@timed("extraction")
+def read_text_file(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+def _extract_page_range(file_path, start, stop) -> List[str]:
+    with fitz.open(file_path) as doc:
+        return [doc[i].get_text() for i in range(start, stop)]
+
+def read_pdf_pages(file_path) -> List[str]:
+    """Returns the text of every page of `file_path` in order, or [] if the PDF cannot be read."""
+    return extract_pdf_pages_many([file_path])[file_path]
+
+def read_pdf_file_robust(file_path) -> str:
+    return "".join(read_pdf_pages(file_path))
+
+def read_pdf_page_range(file_path, start: int = 0, stop: Optional[int] = None) -> Tuple[List[str], int, bool]:
+    """
+    Returns the texts of pages [start, stop), the document's page count and
+    whether they came from the text cache. On a cache miss only the requested
+    pages are parsed; the whole document is left to read_pdf_pages to cache.
+    """
+    cached = get_text_cache().get(file_digest(file_path))
+    if cached is not None:
+        return cached[start:stop], len(cached), True
+    with stage_timer("extraction"), fitz.open(file_path) as doc:
+        page_count = doc.page_count
+        stop = page_count if stop is None else min(stop, page_count)
+        return [doc[i].get_text() for i in range(start, stop)], page_count, False
+
+# ------------------ Process pool ------------------
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # Never fork: the caller has torch, uvicorn and watcher threads whose locks a forked child could inherit held.
+        method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        _pool = ProcessPoolExecutor(max_workers=PDF_WORKERS, mp_context=multiprocessing.get_context(method))
+    return _pool
+
+def shutdown_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=True, cancel_futures=True)
+        _pool = None
+
+atexit.register(shutdown_pool)
+
+@timed("extraction")
+def extract_pdf_pages_many(paths: Iterable[str], max_workers: Optional[int] = None) -> Dict[str, List[str]]:
+    """
+    Extracts page texts for many PDFs at once. Every document is split into
+    page ranges of PDF_PAGES_PER_TASK and the ranges are fanned out across
+    the process pool, so both many small files and a single large chart use
+    all workers. Results keep page order; unreadable files map to [].
+    Documents already in the text cache are not parsed again.
+    """
+    workers = PDF_WORKERS if max_workers is None else max_workers
+    cache = get_text_cache()
+    results: Dict[str, List[str]] = {}
+    digests: Dict[str, str] = {}
+    tasks = []
+    for path in dict.fromkeys(paths):
+        try:
+            digests[path] = file_digest(path)
+        except OSError as e:
+            print(f"Error reading {path}: {e}")
+            results[path] = []
+            continue
+        cached = cache.get(digests[path])
+        if cached is not None:
+            results[path] = cached
+            continue
+        try:
+            with fitz.open(path) as doc:
+                page_count = doc.page_count
+        except Exception as e:
+            print(f"Error reading {path}: {e}")
+            results[path] = []
+            continue
+        results[path] = [""] * page_count
+        for start in range(0, page_count, PDF_PAGES_PER_TASK):
+            tasks.append((path, start, min(start + PDF_PAGES_PER_TASK, page_count)))
+
+    failed = set()
+    if workers <= 1 or len(tasks) <= 1:
+        for path, start, stop in tasks:
+            if path in failed:
+                continue
+            try:
+                results[path][start:stop] = _extract_page_range(path, start, stop)
+            except Exception as e:
+                print(f"Error reading {path}: {e}")
+                failed.add(path)
+    else:
+        try:
+            pool = get_pool()
+            futures = [(pool.submit(_extract_page_range, *task), task) for task in tasks]
+            for future, (path, start, stop) in futures:
+                try:
+                    results[path][start:stop] = future.result()
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    if path not in failed:
+                        print(f"Error reading {path}: {e}")
+                    failed.add(path)
+        except BrokenProcessPool:
+            print("⚠️ PDF worker pool crashed, extracting in-process instead")
+            shutdown_pool()
+            return extract_pdf_pages_many(list(results), max_workers=1)
+
+    for path in failed:
+        results[path] = []
+    for path in {task[0] for task in tasks} - failed:
+        cache.put(digests[path], results[path])
+    return results
+
+def read_documents(paths: Iterable[str]) -> Dict[str, str]:
+    """Returns the full text of every .pdf/.txt in `paths`; PDFs are parsed in parallel."""
+    texts = {}
+    pdf_paths = []
+    for path in paths:
+        ext = os.path.basename(path).lower().split('.')[-1]
+        if ext == 'txt':
+            texts[path] = read_text_file(path)
+        elif ext == 'pdf':
+            pdf_paths.append(path)
+    for path, pages in extract_pdf_pages_many(pdf_paths).items():
+        texts[path] = "".join(pages)
+    return texts
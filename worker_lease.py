@@ -0,0 +1,50 @@
+import os
+import fcntl
+from typing import Optional
+
+# Lock file that decides which API worker owns the data watcher and the regeneration queue.
+WATCHER_LEASE_PATH = os.getenv("WATCHER_LEASE_PATH", ".watcher.lease")
+
+class FileLease:
+    """
+    Non-blocking exclusive flock held for the life of the process. The kernel
+    drops it when the holder exits or crashes, so a follower retrying
+    try_acquire() takes over without any expiry bookkeeping.
+    """
+
+    def __init__(self, path: str = WATCHER_LEASE_PATH):
+        self.path = path
+        self._fd: Optional[int] = None
+
+    @property
+    def held(self) -> bool:
+        return self._fd is not None
+
+    def try_acquire(self) -> bool:
+        if self._fd is not None:
+            return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        os.ftruncate(fd, 0)
+        os.write(fd, f"{os.getpid()}\n".encode())
+        self._fd = fd
+        return True
+
+    def holder(self) -> Optional[int]:
+        """PID recorded by the current holder, if any."""
+        try:
+            with open(self.path) as f:
+                return int(f.read().strip() or 0) or None
+        except (OSError, ValueError):
+            return None
+
+    def release(self):
+        if self._fd is None:
+            return
+        fcntl.flock(self._fd, fcntl.LOCK_UN)
+        os.close(self._fd)
+        self._fd = None